@@ -0,0 +1,200 @@
+# Reproducible benchmark suite of the hot paths: graph build, find_path, get_random_destination,
+# CityModel.step at several car counts and the serialization of the endpoints of traffic_server.py.
+# Every case uses pinned seeds. Maps: the maps of city_files, tiled copies of new_map.txt and
+# maps generated with traffic_base.mapgen.
+# Results (seconds per operation, lower is better) are printed, saved as JSON with --out (outside
+# the source tree) and can be compared against a previous file: any case slower than the threshold
+# is reported and the exit code is 1.
+# Run from any directory:
+#   python benchmarks/benchmark_suite.py [--quick] [--out /tmp/results.json] [--compare baseline.json] [--threshold 0.2]
+
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Sin chdir: las rutas de los argumentos son relativas al directorio actual
+# y los mapas se resuelven contra el paquete (map_loader.resolve_path)
+sys.path.insert(0, BASE_DIR)
+
+from traffic_base.map_loader import resolve_path
+from traffic_base.mapgen import generate_map, write_map
+from traffic_base.model import CityModel
+from traffic_base.serialization import MODEL_OPERATIONS, columnar_frame, encode_frame
+
+SEED = 42
+
+MAPS = [
+    "city_files/new_map.txt",
+    "city_files/2021_base.txt",
+    "city_files/2022_base.txt",
+    "city_files/2023_base.txt",
+    "city_files/2024_base.txt",
+    "city_files/2025_base.txt",
+]
+
+def tiled_map(map_file, tiles, directory):
+    """Write map_file repeated tiles x tiles times and return the path of the new map"""
+    with open(resolve_path(map_file)) as f:
+        lines = [line.strip() for line in f if line.strip()]
+    path = os.path.join(directory, f"{os.path.splitext(os.path.basename(map_file))[0]}_x{tiles}.txt")
+    with open(path, "w") as f:
+        for _ in range(tiles):
+            for line in lines:
+                f.write(line * tiles + "\n")
+    return path
+
+def synthetic_map(size, directory):
+    """Write a generated size x size map and return its path"""
+    path = os.path.join(directory, f"synthetic_{size}.txt")
+    write_map(generate_map(size, size, seed=SEED), path)
+    return path
+
+def best_time(function, repeats, number=1):
+    """Best wall time of repeats runs of number calls, per call"""
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for _ in range(number):
+            function()
+        best = min(best, (time.perf_counter() - start) / number)
+    return best
+
+def map_name(map_file):
+    return os.path.splitext(os.path.basename(map_file))[0]
+
+def bench_graph(results, map_files, repeats):
+    for map_file in map_files:
+        model = CityModel(N=0, seed=SEED, map_file=map_file)
+        results[f"graph_build/{map_name(map_file)}"] = best_time(model.create_directional_graph, repeats)
+
+def bench_pathfinding(results, map_files, repeats, queries):
+    for map_file in map_files:
+        model = CityModel(N=0, seed=SEED, map_file=map_file)
+        rng = random.Random(SEED)
+        nodes = list(model.graph.keys())
+        pairs = [(rng.choice(model.spawn_corners), rng.choice(model.destinations)) for _ in range(queries // 2)]
+        pairs += [(rng.choice(nodes), rng.choice(nodes)) for _ in range(queries - len(pairs))]
+
+        def find_paths():
+            for start, goal in pairs:
+                model.find_path(start, goal)
+        results[f"find_path/{map_name(map_file)}"] = best_time(find_paths, repeats) / len(pairs)
+
+        origins = [rng.choice(model.spawn_corners + nodes[:50]) for _ in range(queries)]
+        def random_destinations():
+            for origin in origins:
+                model.get_random_destination(origin)
+        results[f"random_destination/{map_name(map_file)}"] = best_time(random_destinations, repeats) / len(origins)
+
+def bench_step(results, map_files, car_counts, warmup, steps):
+    for map_file in map_files:
+        for cars in car_counts:
+            model = CityModel(N=cars, spawn_time=1, seed=SEED, map_file=map_file)
+            for _ in range(warmup):
+                model.step()
+            start = time.perf_counter()
+            for _ in range(steps):
+                model.step()
+            results[f"step/{map_name(map_file)}/N={cars}"] = (time.perf_counter() - start) / steps
+
+def bench_serialization(results, map_file, cars, warmup, repeats):
+    model = CityModel(N=cars, spawn_time=1, seed=SEED, map_file=map_file)
+    for _ in range(warmup):
+        model.step()
+    name = map_name(map_file)
+    since = model.steps - 1
+
+    def dumps(operation, *args):
+        return lambda: json.dumps(MODEL_OPERATIONS[operation](model, *args), separators=(",", ":"))
+
+    cases = {
+        "getCars": dumps("cars"),
+        "getCars_delta": dumps("cars", since),
+        "getTrafficLights": dumps("traffic_lights"),
+        "getRoad": dumps("static", "Road"),
+        "step_columnar": lambda: json.dumps(columnar_frame(model), separators=(",", ":")),
+        "stream_frame": lambda: encode_frame(model),
+    }
+    for case, function in cases.items():
+        results[f"serialization/{case}/{name}"] = best_time(function, repeats, number=10)
+
+def compare(results, baseline, threshold):
+    """Print the change of every case against the baseline results; returns the regressed cases"""
+    regressions = []
+    print(f"\n{'case':<48}{'baseline':>12}{'current':>12}{'change':>9}")
+    for case, seconds in results.items():
+        if case not in baseline:
+            continue
+        change = seconds / baseline[case] - 1 if baseline[case] else 0.0
+        flag = ""
+        if change > threshold:
+            regressions.append(case)
+            flag = "  <-- regression"
+        print(f"{case:<48}{baseline[case] * 1000:>10.3f}ms{seconds * 1000:>10.3f}ms{change:>+9.1%}{flag}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark suite of pathfinding, stepping and serialization")
+    parser.add_argument("--quick", action="store_true", help="Fewer maps, repeats and steps")
+    parser.add_argument("--out", help="File to save the results (JSON); not saved without it")
+    parser.add_argument("--compare", help="Baseline results to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Maximum relative slowdown of a case")
+    args = parser.parse_args()
+
+    # La línea base se lee antes de correr (puede ser el mismo archivo que --out)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+
+    repeats = 3 if args.quick else 5
+    queries = 100 if args.quick else 400
+    car_counts = [100, 1000] if args.quick else [100, 1000, 5000]
+    warmup, steps = (50, 50) if args.quick else (200, 200)
+    tiles = [2] if args.quick else [2, 4, 8]
+    sizes = [200] if args.quick else [200, 500]
+
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        tiled_maps = [tiled_map(MAPS[0], count, directory) for count in tiles]
+        synthetic_maps = [synthetic_map(size, directory) for size in sizes]
+        maps = (MAPS[:1] if args.quick else MAPS) + tiled_maps + synthetic_maps
+
+        bench_graph(results, maps, repeats)
+        bench_pathfinding(results, maps, repeats, queries)
+        bench_step(results, [MAPS[0], tiled_maps[-1], synthetic_maps[0]], car_counts, warmup, steps)
+        bench_serialization(results, tiled_maps[0], car_counts[-1], warmup, repeats)
+
+    print(f"{'case':<48}{'ms per op':>12}")
+    for case, seconds in results.items():
+        print(f"{case:<48}{seconds * 1000:>12.4f}")
+
+    output = {
+        "meta": {
+            "seed": SEED,
+            "quick": args.quick,
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": results,
+    }
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(output, f, indent=2)
+        print(f"\nResults saved to {args.out}")
+
+    if baseline is not None:
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regressions above {args.threshold:.0%}")
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+# Compare the agent step (CityModel) with the batched step (BatchCityModel):
+# datacollector metrics and the per-cell occupancy of the cars over several seeds, and steps per second.
+# On new_map only about 70 cars are active at once (4 spawn corners), so both modes are bound by
+# per-step overhead; the batched step pays off on larger maps (--map with a tiled or generated map).
+# Run from any directory:
+#   python benchmarks/compare_step_modes.py [--agents 2000] [--spawn-time 1] [--steps 300] [--seeds 1 2 3] [--congestion-rerouting]
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Sin chdir: las rutas de los argumentos son relativas al directorio actual
+# y los mapas se resuelven contra el paquete (map_loader.resolve_path)
+sys.path.insert(0, BASE_DIR)
+
+from traffic_base.batch import BatchCityModel
+from traffic_base.model import CityModel
+
+# Average_moves no se compara: solo cuentan los movimientos en "Exploring",
+# que con las tablas de rutas casi no ocurre (vale 0 en ambos modos)
+METRICS = ["Active_cars", "Arrived_per_step", "Total_arrived", "Total_spawned"]
+
+def run(model_class, args, seed):
+    """
+    Run one simulation and return (steps per second, metrics dataframe, occupancy),
+    occupancy being the car-steps spent in each cell (flat x * height + y).
+    """
+    model = model_class(N=args.agents, spawn_time=args.spawn_time, seed=seed, map_file=args.map,
+                        congestion_rerouting=args.congestion_rerouting)
+    occupancy = np.zeros(model.width * model.height, dtype=np.int64)
+    elapsed = 0.0
+    for _ in range(args.steps):
+        start = time.perf_counter()
+        model.step()
+        elapsed += time.perf_counter() - start
+        occupancy += model.occupancy_index.as_array()
+    return args.steps / elapsed, model.datacollector.get_model_vars_dataframe(), occupancy
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the agent step with the batched step")
+    parser.add_argument("--agents", type=int, default=2000)
+    parser.add_argument("--spawn-time", type=int, default=1)
+    parser.add_argument("--steps", type=int, default=300)
+    parser.add_argument("--seeds", type=int, nargs="+", default=[1, 2, 3])
+    parser.add_argument("--map", default="city_files/new_map.txt")
+    parser.add_argument("--congestion-rerouting", action="store_true",
+                        help="Reroute blocked cars around congestion in both modes")
+    parser.add_argument("--tolerance", type=float, default=0.15,
+                        help="Maximum relative difference of the metric means")
+    args = parser.parse_args()
+
+    results = {}
+    for name, model_class in (("agent", CityModel), ("batch", BatchCityModel)):
+        speeds, frames, occupancy = [], [], 0
+        for seed in args.seeds:
+            speed, frame, cells = run(model_class, args, seed)
+            speeds.append(speed)
+            frames.append(frame)
+            occupancy = occupancy + cells
+        results[name] = (speeds, frames, occupancy)
+        print(f"{name:>6}: {statistics.mean(speeds):8.1f} steps/s")
+
+    failed = False
+    print(f"\n{'metric':<18} {'agent mean':>11} {'batch mean':>11} {'agent std':>10} {'batch std':>10}")
+    for metric in METRICS:
+        agent_values = [value for frame in results["agent"][1] for value in frame[metric]]
+        batch_values = [value for frame in results["batch"][1] for value in frame[metric]]
+        agent_mean, batch_mean = statistics.mean(agent_values), statistics.mean(batch_values)
+        difference = abs(agent_mean - batch_mean) / max(abs(agent_mean), 1e-9)
+        flag = "" if difference <= args.tolerance else "  <-- outside tolerance"
+        if statistics.pstdev(agent_values) == 0 and statistics.pstdev(batch_values) == 0:
+            flag = "  <-- constant in both modes, not informative"
+        failed = failed or bool(flag)
+        print(f"{metric:<18} {agent_mean:11.3f} {batch_mean:11.3f} "
+              f"{statistics.pstdev(agent_values):10.3f} {statistics.pstdev(batch_values):10.3f}{flag}")
+
+    # Posiciones de los carros: distancia de variación total entre las distribuciones
+    # de carro-steps por celda de ambos modos (0 = mismas celdas en la misma proporción)
+    agent_cells, batch_cells = results["agent"][2], results["batch"][2]
+    distance = 0.5 * np.abs(agent_cells / max(agent_cells.sum(), 1) - batch_cells / max(batch_cells.sum(), 1)).sum()
+    flag = "" if distance <= args.tolerance else "  <-- outside tolerance"
+    failed = failed or bool(flag)
+    print(f"\nCar positions (total variation distance of the per-cell occupancy): {distance:.3f}{flag}")
+
+    speedup = statistics.mean(results["batch"][0]) / statistics.mean(results["agent"][0])
+    print(f"\nSpeedup: {speedup:.2f}x")
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+# Benchmark: heap-based A* (AStarPathfinder) vs. the original list-scan A*.
+# Run from any directory:
+#   python benchmarks/pathfinding_benchmark.py [--pairs 200] [--seed 42]
+
+import argparse
+import os
+import random
+import sys
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Sin chdir: las rutas de los argumentos son relativas al directorio actual
+# y los mapas se resuelven contra el paquete (map_loader.resolve_path)
+sys.path.insert(0, BASE_DIR)
+
+from traffic_base.model import CityModel
+
+MAPS = [
+    "city_files/new_map.txt",
+    "city_files/2021_base.txt",
+    "city_files/2022_base.txt",
+    "city_files/2023_base.txt",
+    "city_files/2024_base.txt",
+    "city_files/2025_base.txt",
+]
+
+def build_queries(model, pairs, rng):
+    """Spawn corner -> destination queries plus random node pairs"""
+    nodes = list(model.graph.keys())
+    destinations = [pos for pos, symbol in model.map_grid.items() if symbol == "D" and pos in model.graph]
+
+    queries = [(corner, dest) for corner in model.spawn_corners for dest in destinations]
+    queries += [(rng.choice(nodes), rng.choice(nodes)) for _ in range(pairs)]
+    return queries
+
+def time_queries(find_path, queries):
+    """Run every query and return (elapsed seconds, paths)"""
+    start = time.perf_counter()
+    paths = [find_path(start_pos, goal_pos) for start_pos, goal_pos in queries]
+    return time.perf_counter() - start, paths
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare heap A* against the list-scan A*")
+    parser.add_argument("--pairs", type=int, default=200, help="Random node pairs per map")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    print(f"{'map':<28}{'queries':>9}{'list scan (ms)':>16}{'heap (ms)':>12}{'speedup':>10}  same paths")
+    for map_file in MAPS:
+        model = CityModel(N=0, map_file=map_file)
+        queries = build_queries(model, args.pairs, random.Random(args.seed))
+
+        old_time, old_paths = time_queries(model.find_path_list_scan, queries)
+        new_time, new_paths = time_queries(model.find_path, queries)
+
+        speedup = old_time / new_time if new_time else float("inf")
+        same = old_paths == new_paths
+        print(f"{os.path.basename(map_file):<28}{len(queries):>9}{old_time * 1000:>16.1f}"
+              f"{new_time * 1000:>12.1f}{speedup:>9.1f}x  {same}")
+
+if __name__ == "__main__":
+    main()
@@ -51,7 +51,8 @@ def post_process_lines(ax):
     ax.set_xlabel("Step")
     ax.set_ylabel("Count")
 
-model = CityModel()
+# Solara dibuja todas las celdas, así que los agentes estáticos se crean desde el inicio
+model = CityModel(lazy_agents=False)
 
 renderer = SpaceRenderer(
     model,
@@ -79,6 +80,13 @@ model_params = {
         "value": 42,
         "label": "Random Seed",
     },
+    "lazy_agents": False,
+    "graph_backend": {
+        "type": "Select",
+        "value": "dict",
+        "values": ["dict", "csr"],
+        "label": "Graph backend",
+    },
 }
 
 page = SolaraViz(
@@ -0,0 +1,52 @@
+# Tests of the worker-process backend (traffic_base.workers) with the session registry.
+# Run from trafficBase:
+#   python -m pytest tests
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from traffic_base.sessions import DEFAULT_SESSION, SessionRegistry
+from traffic_base.workers import ModelWorkerPool
+
+PARAMETERS = {"N": 20, "spawn_time": 1}
+
+@pytest.fixture
+def pool():
+    pool = ModelWorkerPool(1, start_method="spawn")
+    yield pool
+    pool.shutdown()
+
+def test_reinit_same_session_keeps_new_model(pool):
+    sessions = SessionRegistry()
+    factory = lambda sid: pool.create_model(sid, **PARAMETERS)
+
+    first = sessions.create(factory, DEFAULT_SESSION)
+    first.run("step")
+    # /init otra vez con el mismo id (reset del cliente WebGL, clientes sin sesión)
+    second = sessions.create(factory, DEFAULT_SESSION)
+
+    assert sessions.get(DEFAULT_SESSION) is second
+    assert pool.loads == [1]
+    second.run("step")
+    assert second.run("cars")["positions"]
+
+    sessions.remove(DEFAULT_SESSION)
+    assert pool.loads == [0]
+
+def test_close_releases_load_when_worker_fails(pool):
+    model = pool.create_model("s1", **PARAMETERS)
+    assert pool.loads == [1]
+    # Worker caído: el close falla
+    pool.processes[0].kill()
+    pool.processes[0].join()
+
+    with pytest.raises(Exception):
+        model.close()
+    assert pool.loads == [0]
+    # Un segundo close no vuelve a descontar la carga
+    model.close()
+    assert pool.loads == [0]
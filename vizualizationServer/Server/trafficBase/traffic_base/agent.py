@@ -1,4 +1,6 @@
 from mesa.discrete_space import CellAgent, FixedAgent
+from mesa.discrete_space.cell_agent import HasCell
+from .map_loader import CELL_DESTINATION, CELL_OBSTACLE, CELL_ROAD, CELL_TRAFFIC_LIGHT
 from math import sqrt
 import random
 
@@ -33,6 +35,31 @@ class Car(CellAgent):
         self.moves = 0 # Contador de movimientos
         self.has_arrived = False # Contador de agentes en destino
 
+        # Telemetría del viaje (model.trip_log la guarda cuando el carro sale del grid)
+        self.origin = cell.coordinate
+        self.spawn_step = model.steps
+        self.red_light_waits = 0 # Steps detenido por un semáforo en rojo
+        self.car_blocks = 0 # Steps bloqueado por otro carro
+        self.reroutes = 0 # Rutas recalculadas
+        self.waiting_for = None # "car" o "light": lo que detuvo al carro, hasta que vuelva a avanzar
+
+    @property
+    def cell(self):
+        return self._mesa_cell
+
+    @cell.setter
+    def cell(self, cell):
+        """Move the car and keep the model occupancy index, car tracker and metric counters up to date"""
+        if self._mesa_cell is not None and cell is None:
+            # El carro sale de la simulación: sus movimientos dejan de contar en el promedio
+            self.model.active_moves -= self.moves
+            self.model.trip_log.record(self, self.model.steps)
+
+        HasCell.cell.fset(self, cell)
+
+        # El tracker actualiza el índice de ocupación (celdas y posición del carro)
+        self.model.car_tracker.move(self.unique_id, cell.coordinate if cell is not None else None)
+
     def follow_path(self):
         """
         Follow the route obtained by using the algorithm A*
@@ -51,6 +78,7 @@ class Car(CellAgent):
         
         # Verificar si el movimiento a la siguiente celda es básico
         if self.can_move_to_cell(next_cell):
+            self.waiting_for = None
             old_position = self.cell.coordinate
             self.cell = next_cell
             self.path_index += 1
@@ -68,28 +96,38 @@ class Car(CellAgent):
     def can_move_to_cell(self, next_cell):
         """
         Check if the cell can move to an specific locatiom
+        (O(1) lookups in the static layers and the occupancy index)
         """
+        city_map = self.model.city_map
+        x, y = next_cell.coordinate
+        index = x * city_map.height + y
+        cell_type = city_map.flat_cell_type[index]
+        self.waiting_for = None
+
         # Verificar obstáculos
-        if any(isinstance(agent, Obstacle) for agent in next_cell.agents):
+        if cell_type == CELL_OBSTACLE:
             return False
         
         # Verificar otros carros
-        if any(isinstance(agent, Car) for agent in next_cell.agents):
+        if self.model.occupancy_index.cells[index]:
+            self.waiting_for = "car"
             return False
         
         # Verificar semáforo
-        if not self.evaluate_traffic_light(next_cell):
+        light = city_map.flat_light_id[index]
+        if light >= 0 and not self.model.traffic_lights[light].state:
+            self.waiting_for = "light"
             return False
         
         # Verificar que sea carretera o destino
-        if not any(isinstance(agent, (Road, Destination, Traffic_Light)) for agent in next_cell.agents):
+        if cell_type != CELL_ROAD and cell_type != CELL_TRAFFIC_LIGHT and cell_type != CELL_DESTINATION:
             return False
         
         return True
 
     def recalculate_route(self):
         """
-        Recalculating the route using A*
+        Recalculating the route around the current congestion (model.get_reroute)
         """
         #print(f"old path: {self.path}")
 
@@ -101,7 +139,8 @@ class Car(CellAgent):
         current_coords = self.cell.coordinate
         destination_coords = self.destination.coordinate
                 
-        new_path = self.model.find_path(current_coords, destination_coords)
+        new_path = self.model.get_reroute(current_coords, destination_coords)
+        self.reroutes += 1
         #print(f"New path: {new_path}")
         
         if new_path:
@@ -128,19 +167,30 @@ class Car(CellAgent):
             self.recalculate_route()
         
         elif self.state == "Exploring":
+            self.waiting_for = None
             self.moves += 1
+            self.model.active_moves += 1
+            self.model.total_moves += 1
             self.move()
             
             # Recalcular ruta mientras explora
             if self.model.steps_count % 5 == 0 and self.destination:
                 current_coords = self.cell.coordinate
                 destination_coords = self.destination.coordinate
-                new_path = self.model.find_path(current_coords, destination_coords)
+                new_path = self.model.get_reroute(current_coords, destination_coords)
+                self.reroutes += 1
                 if new_path:
                     self.path = new_path
                     self.path_index = 0
                     self.state = "Following_route"
 
+        # Un step detenido cuenta una sola vez, aunque el carro alterne entre
+        # intentar avanzar (Following_route) y recalcular la ruta
+        if self.waiting_for == "car":
+            self.car_blocks += 1
+        elif self.waiting_for == "light":
+            self.red_light_waits += 1
+
     def check_if_reached_destination(self):
         """
         Verifica si el carro ha llegado a su destino
@@ -153,8 +203,7 @@ class Car(CellAgent):
             # print(f"Carro llegó a destino en {self.cell.coordinate}, eliminando...")
             self.has_arrived = True
             self.state = "In destination"
-            if hasattr(self.model, '_arrived_this_step'):
-                self.model._arrived_this_step += 1
+            self.model._arrived_this_step += 1
             self.model.total_arrived += 1
             
             # Remover el agente
@@ -170,15 +219,12 @@ class Car(CellAgent):
         - True: Green traffic light, proceed
         - False: Red traffic light, stop
         """
-        # Check if there's a traffic light in the next cell
-        for agent in next_cell.agents:
-            ##print(agent)
-            if isinstance(agent, Traffic_Light):
-                # If there's a traffic light, check its state
-                # state = True means green (can pass)
-                # state = False means red (cannot pass)
-                ##print(agent.state)
-                return agent.state
+        # Check if there's a traffic light in the next cell (light id layer)
+        light = self.model.city_map.light_id_at(next_cell.coordinate)
+        if light >= 0:
+            # state = True means green (can pass)
+            # state = False means red (cannot pass)
+            return self.model.traffic_lights[light].state
         
         # If there's no traffic light, the car can proceed
         return True
@@ -188,8 +234,9 @@ class Car(CellAgent):
         Return an array with the position of each near cell with destinations 
         (radius: 2)
         """
+        city_map = self.model.city_map
         cells_with_destination = self.cell.get_neighborhood(2, False).select(
-            lambda cell: any(isinstance(obj, Destination) for obj in cell.agents)
+            lambda cell: city_map.type_at(cell.coordinate) == CELL_DESTINATION
         )
         return cells_with_destination
 
@@ -198,8 +245,9 @@ class Car(CellAgent):
        Return an array with the position of each near cell with traffic lights 
        (radius: 2)
         """
+        city_map = self.model.city_map
         cells_with_traffic_light = self.cell.get_neighborhood(2, False).select(
-            lambda cell: any(isinstance(obj, Traffic_Light) for obj in cell.agents)
+            lambda cell: city_map.type_at(cell.coordinate) == CELL_TRAFFIC_LIGHT
         )
         return cells_with_traffic_light
 
@@ -208,8 +256,9 @@ class Car(CellAgent):
         Return an array with the position of each near cell without obstacles 
         (radius: 2)
         """
+        city_map = self.model.city_map
         cells_without_obstacles = self.cell.get_neighborhood(2, False).select(
-            lambda cell: not any(isinstance(obj, Obstacle) for obj in cell.agents)
+            lambda cell: not city_map.is_obstacle(cell.coordinate)
         )
         return cells_without_obstacles
 
@@ -218,25 +267,18 @@ class Car(CellAgent):
         Return an array with the position of each near cell with road 
         (radius: 1)
         """
+        city_map = self.model.city_map
         cells_with_road = self.cell.neighborhood.select(
-            lambda cell: any(isinstance(obj, (Road, Traffic_Light)) for obj in cell.agents)
+            lambda cell: city_map.type_at(cell.coordinate) in (CELL_ROAD, CELL_TRAFFIC_LIGHT)
         )
         return cells_with_road
 
     def get_road_direction(self, cell):
         """
         Obtains the direction expected by the road
+        (a tuple for intersections, None if the cell is not a road)
         """
-        for agent in cell.agents:
-            if isinstance(agent, Road):
-                # Si tiene segunda dirección (intersección), retornar tupla
-                if agent.direction2:
-                    return (agent.direction, agent.direction2)
-                else:
-                    return agent.direction
-            elif isinstance(agent, Traffic_Light):
-                return agent.direction
-        return None
+        return self.model.city_map.road_direction(cell.coordinate)
     
     def validate_road_direction(self, current_cell, next_cell):
         """ Validate if the agent movement is correct according to the road direction """
@@ -321,55 +363,30 @@ class Car(CellAgent):
         # Filter cells to find just the valid ones
         possible_cells = []
 
-        road_cells = self.is_cells_a_road()
-        non_obstacles_cells = self.is_cells_without_obstacles()
+        city_map = self.model.city_map
+        occupancy = self.model.occupancy_index.cells
         destination = [self.destination]
       
         for cell in neighbor_cells:
-            #print(f"\n  Evaluando celda {cell.coordinate}:")
+            x, y = cell.coordinate
+            index = x * city_map.height + y
+            cell_type = city_map.flat_cell_type[index]
 
-            # Check if it is road
-            if cell not in road_cells:
-                #print(f"No es carretera")
+            # Check if it is road (a road cell is never an obstacle)
+            if cell_type != CELL_ROAD and cell_type != CELL_TRAFFIC_LIGHT:
                 continue
-            ##print(f"Es carretera")
-                
-            # Check if has obstacles            
-            if cell not in non_obstacles_cells:
-                ##print(f"Tiene obstáculo")
-                continue
-            ##print(f"Sin obstáculos")
                 
             # Check if it has other cars
-            has_cars = any(isinstance(agent, Car) for agent in cell.agents)
-            
-            if has_cars:
-                ##print(f"Tiene otro carro")
+            if occupancy[index]:
                 continue
-            ##print(f"Sin carros")
 
-            can_pass_traffic_light = self.evaluate_traffic_light(cell)
             #Check traffic light state before adding to possible cells
-        
-            if not can_pass_traffic_light:
-                ##print(f"Semáforo en rojo")
+            if not self.evaluate_traffic_light(cell):
                 continue
-            ##print(f"Semáforo permite pasar")
 
             if cell in destination:
-                #print("No es mi destino")
                 continue
-            #print("Es mi destino")
 
-            # Check if the movement is valid according to the direction of the road
-
-            cd = self.get_road_direction(cell)
-            if isinstance(cd, tuple):
-                cell_direction = cd[1]
-            else:
-                cell_direction = cd
-            #print(f"Dirección de la celda destino: {cell_direction}")
-            
             # Check if the movement is valid according to the direction of the road
             is_valid_move = self.validate_road_direction(self.cell, cell)
             #print(f"    {'si' if is_valid_move else 'x'} Movimiento {'válido' if is_valid_move else 'inválido'}")
@@ -437,6 +454,7 @@ class Traffic_Light(FixedAgent):
     def step(self):
         """ 
         To change the state (green or red) of the traffic light in case you consider the time to change of each traffic light.
+        CityModel does not call it anymore: its LightScheduler changes the lights only at their scheduled steps.
         """
         if self.model.steps % self.timeToChange == 0:
             self.state = not self.state
@@ -0,0 +1,321 @@
+import numpy as np
+
+from .model import CityModel
+
+# Estados de los carros en los arreglos (equivalentes a Car.state)
+FOLLOWING = 0     # "Following_route"
+RECALCULATING = 1 # "Recalculating route"
+EXPLORING = 2     # "Exploring"
+
+# Estado de cada carro durante la resolución de movimientos de un step
+PENDING = 0
+MOVED = 1
+BLOCKED = 2
+
+class BatchCityModel(CityModel):
+    """
+    Vectorized simulation mode of CityModel.
+
+    Cars are not mesa agents: positions, destinations, path indices and
+    states live in NumPy arrays, and the moves of all cars are resolved in one
+    batched pass per step. Conflicts for the same cell are settled with a
+    seeded random priority that reproduces the shuffled agent order: a car can
+    enter a cell only if it was free at its turn in that order.
+
+    Difference with the agent mode: cars in "Exploring" state wait in place
+    (instead of Car.move) until a route is found.
+    """
+
+    def __init__(self, N=10000, spawn_time=10, seed=42, **kwargs):
+        super().__init__(N, spawn_time, seed, **kwargs)
+
+        capacity = max(int(self.num_agents), 1)
+        self.car_pos = np.zeros(capacity, dtype=np.int64)        # Índice plano de la celda
+        self.car_dest = np.zeros(capacity, dtype=np.int64)
+        self.car_path_start = np.zeros(capacity, dtype=np.int64) # Inicio de la ruta en path_pool
+        self.car_path_len = np.zeros(capacity, dtype=np.int64)
+        self.car_path_index = np.zeros(capacity, dtype=np.int64)
+        self.car_path_version = np.zeros(capacity, dtype=np.int64)
+        self.car_state = np.zeros(capacity, dtype=np.int8)
+        self.car_moves = np.zeros(capacity, dtype=np.int64)
+        self.car_alive = np.zeros(capacity, dtype=bool)
+
+        # Rutas compartidas: cada (origen, destino, versión del grafo) se guarda una sola vez
+        self.path_pool = np.zeros(1024, dtype=np.int64)
+        self.path_pool_size = 0
+        self.route_offsets = {}
+
+        # Capas del mapa como arreglos planos (índice x * height + y)
+        cell_type = np.asarray(self.city_map.flat_cell_type, dtype=np.uint8)
+        self.drivable = np.isin(cell_type, [1, 2, 4])
+        self.light_at = np.asarray(self.city_map.flat_light_id, dtype=np.int64)
+        # Los carros del batch no son agentes: solo usan la capa de celdas del índice de ocupación
+        self.occupancy = self.occupancy_index.as_array()
+
+        self.light_green = np.array([light.state for light in self.traffic_lights], dtype=bool)
+
+        # Buffers por celda reutilizados entre steps (se limpian solo las celdas tocadas)
+        cells = self.width * self.height
+        self.cell_owner = np.full(cells, -1, dtype=np.int64)
+        self.vacated_rank = np.full(cells, -1, dtype=np.int64)
+
+        self._arrived_this_step = 0
+
+    def flat(self, pos):
+        return pos[0] * self.height + pos[1]
+
+    def store_route(self, path, shared=True):
+        """
+        Store a path in path_pool and return (start, length).
+        Shared paths are stored once per origin/destination; congestion
+        reroutes (shared=False) depend on the step and are always appended.
+        """
+        key = (path[0], path[-1], self.graph_version)
+        if shared:
+            stored = self.route_offsets.get(key)
+            if stored is not None:
+                return stored
+
+        length = len(path)
+        while self.path_pool_size + length > len(self.path_pool):
+            self.path_pool = np.concatenate([self.path_pool, np.zeros(len(self.path_pool), dtype=np.int64)])
+        start = self.path_pool_size
+        self.path_pool[start:start + length] = [x * self.height + y for x, y in path]
+        self.path_pool_size += length
+
+        if shared:
+            self.route_offsets[key] = (start, length)
+        return start, length
+
+    def assign_route(self, car, path, shared=True):
+        """Give a new route to a car and put it back in "Following_route" state"""
+        start, length = self.store_route(path, shared)
+        self.car_path_start[car] = start
+        self.car_path_len[car] = length
+        self.car_path_index[car] = 0
+        self.car_path_version[car] = self.graph_version
+        self.car_state[car] = FOLLOWING
+
+    def spawn_car(self):
+        """Crear un carro en una esquina aleatoria (en los arreglos)"""
+        if self.cars_spawned >= self.num_agents:
+            return
+        max_cars_to_spawn = min(4, self.num_agents - self.cars_spawned)
+        cars_spawned_this_step = 0
+
+        for corner in self.spawn_corners:
+            if cars_spawned_this_step >= max_cars_to_spawn:
+                break
+
+            if self.cars_spawned >= self.num_agents:
+                break
+
+            if corner not in self.graph or not self.graph[corner]:
+                continue
+
+            if self.occupancy[self.flat(corner)]:
+                continue
+
+            for attempt in range(3):
+                destination_pos = self.get_random_destination(corner)
+                if not destination_pos:
+                    continue
+
+                path_to_follow = self.get_route(corner, destination_pos)
+
+                if path_to_follow:
+                    car = self.cars_spawned
+                    self.car_pos[car] = self.flat(corner)
+                    self.car_dest[car] = self.flat(destination_pos)
+                    self.car_moves[car] = 0
+                    self.car_alive[car] = True
+                    self.assign_route(car, path_to_follow)
+                    self.occupancy[self.car_pos[car]] += 1
+
+                    self.cars_spawned += 1
+                    cars_spawned_this_step += 1
+                    break
+
+    def update_traffic_lights(self):
+        """Change the scheduled lights and copy their state to light_green"""
+        changed = self.light_scheduler.advance(self.steps)
+        if changed:
+            self.light_green[changed] = [self.traffic_lights[light].state for light in changed]
+
+    def recalculate_routes(self, cars):
+        """
+        Route recalculation for cars in "Recalculating route" or "Exploring"
+        state, with model.get_reroute like Car.
+        """
+        if len(cars) == 0:
+            return
+
+        # A path walked from the routing tables passes through the current
+        # position, so its suffix is exactly the route a new query would return
+        # (not with congestion rerouting: the new route depends on the jams)
+        same_table = (self.car_path_version[cars] == self.graph_version) & (self.car_state[cars] == RECALCULATING)
+        table_cars = cars[same_table] if not self.congestion_rerouting else cars[:0]
+        if len(table_cars):
+            table_cars = table_cars[[
+                self.routing.has_destination(self.position(dest))
+                for dest in self.car_dest[table_cars].tolist()
+            ]]
+            self.car_state[table_cars] = FOLLOWING
+
+        for car in cars.tolist():
+            if self.car_state[car] == FOLLOWING:
+                continue
+            new_path = self.get_reroute(self.position(self.car_pos[car]), self.position(self.car_dest[car]))
+            if new_path:
+                self.assign_route(car, new_path, shared=not self.congestion_rerouting)
+            else:
+                self.car_state[car] = EXPLORING
+
+    def position(self, index):
+        """Coordinates of a flat cell index"""
+        return divmod(int(index), self.height)
+
+    def advance_cars(self, cars):
+        """Resolve the moves of every car in "Following_route" state in one batched pass"""
+        if len(cars) == 0:
+            return
+
+        # Ruta terminada sin llegar: recalcular (como Car.follow_path)
+        finished = self.car_path_index[cars] >= self.car_path_len[cars] - 1
+        self.car_state[cars[finished]] = RECALCULATING
+        cars = cars[~finished]
+
+        target = self.path_pool[self.car_path_start[cars] + self.car_path_index[cars] + 1]
+
+        # Celdas no transitables o con semáforo en rojo
+        light = self.light_at[target]
+        passable = self.drivable[target] & ((light < 0) | self.light_green[np.maximum(light, 0)])
+        self.car_state[cars[~passable]] = RECALCULATING
+        cars, target = cars[passable], target[passable]
+
+        count = len(cars)
+        if count == 0:
+            return
+
+        # Prioridad aleatoria con semilla: equivale al orden de shuffle_do
+        rank = self.rng.permutation(count)
+        status = np.full(count, PENDING, dtype=np.int8)
+        origin = self.car_pos[cars]
+        destination = self.car_dest[cars]
+        occupancy, owner, vacated_rank = self.occupancy, self.cell_owner, self.vacated_rank
+        owner[origin] = np.arange(count)
+
+        pending = np.arange(count)
+        while len(pending):
+            cells = target[pending]
+            occupied = occupancy[cells] > 0
+            cell_owner = owner[cells]
+
+            # Occupied by a car that moves earlier in the order and may still
+            # leave in this step: wait for it
+            occupant = np.maximum(cell_owner, 0)
+            waiting = (occupied & (cell_owner >= 0) & (status[occupant] == PENDING)
+                       & (rank[occupant] < rank[pending]))
+            # A free cell can be entered if it was free at this car's turn
+            vacated = vacated_rank[cells]
+            eligible = ~occupied & ((vacated < 0) | (vacated < rank[pending]))
+            blocked = ~waiting & ~eligible
+            status[pending[blocked]] = BLOCKED
+
+            candidates = pending[eligible]
+            if len(candidates) == 0:
+                # Solo quedan carros esperando en ciclos: ninguno puede moverse
+                if not blocked.any():
+                    status[pending] = BLOCKED
+                break
+
+            # The first car (lowest rank) of each cell enters it
+            order = np.lexsort((rank[candidates], target[candidates]))
+            candidates = candidates[order]
+            candidate_cells = target[candidates]
+            first = np.ones(len(candidates), dtype=bool)
+            first[1:] = candidate_cells[1:] != candidate_cells[:-1]
+            winners, losers = candidates[first], candidates[~first]
+
+            new_cells = target[winners]
+            arriving = new_cells == destination[winners]
+
+            # A car that arrives is removed right away, so the cell is free
+            # again for the cars after it; the others find it occupied
+            frees_again = np.isin(target[losers], new_cells[arriving])
+            status[losers[~frees_again]] = BLOCKED
+
+            old_cells = origin[winners]
+            occupancy[old_cells] -= 1
+            vacated_rank[old_cells] = rank[winners]
+            owner[old_cells] = -1
+
+            staying = ~arriving
+            occupancy[new_cells[staying]] += 1
+            owner[new_cells[staying]] = winners[staying]
+            vacated_rank[new_cells[arriving]] = rank[winners[arriving]]
+            status[winners] = MOVED
+
+            pending = np.nonzero(status == PENDING)[0]
+
+        # Limpiar los buffers por celda
+        owner[origin] = -1
+        owner[target] = -1
+        vacated_rank[origin] = -1
+        vacated_rank[target] = -1
+
+        moved = cars[status == MOVED]
+        self.car_pos[moved] = target[status == MOVED]
+        self.car_path_index[moved] += 1
+        self.car_state[cars[status == BLOCKED]] = RECALCULATING
+
+        arrived = moved[self.car_pos[moved] == self.car_dest[moved]]
+        if len(arrived):
+            self.car_alive[arrived] = False
+            self.total_arrived += len(arrived)
+            self._arrived_this_step += len(arrived)
+
+    def step(self):
+        """Advance the model by one step"""
+        if self.steps_count % self.collect_every == 0:
+            self.datacollector.collect(self)
+
+        self.steps_count += 1
+
+        # Spawn de carros deste step 1 y cada spawn_time steps
+        if ((self.steps_count - 1) % self.spawn_time == 0) and self.cars_spawned < self.num_agents:
+            self.spawn_car()
+
+        self.update_traffic_lights()
+
+        alive = np.nonzero(self.car_alive[:self.cars_spawned])[0]
+        state = self.car_state[alive]
+        following = alive[state == FOLLOWING]
+        recalculating = alive[state == RECALCULATING]
+
+        # Exploring: los carros esperan y cada 5 steps buscan una ruta nueva
+        exploring = alive[state == EXPLORING]
+        self.car_moves[exploring] += 1
+        if self.steps_count % 5 != 0:
+            exploring = exploring[:0]
+
+        self.recalculate_routes(np.concatenate([recalculating, exploring]))
+        self.advance_cars(following)
+
+    def car_positions(self):
+        """(car index, (x, y)) of every active car"""
+        cars = np.nonzero(self.car_alive[:self.cars_spawned])[0]
+        return [(car, self.position(index)) for car, index in zip(cars.tolist(), self.car_pos[cars].tolist())]
+
+    @staticmethod
+    def count_active_cars(model):
+        """Count active cars (not at destination)"""
+        return int(np.count_nonzero(model.car_alive))
+
+    @staticmethod
+    def average_moves(model):
+        """Get average moves from all the cars"""
+        alive = model.car_alive[:model.cars_spawned]
+        if alive.any():
+            return float(model.car_moves[:model.cars_spawned][alive].mean())
+        return 0
@@ -0,0 +1,190 @@
+from collections.abc import Mapping
+import numpy as np
+
+class CSRGraph(Mapping):
+    """
+    Compact directional graph stored as CSR (compressed sparse row) arrays.
+
+    Nodes get integer ids. The outgoing edges of node i are
+    targets[offsets[i]:offsets[i + 1]] with the matching costs. Coordinates
+    are mapped to ids with a dense (width, height) array and back with
+    node_x/node_y.
+
+    It also behaves like the dict graph ({pos: [(next_pos, cost), ...]}), so
+    code written for the dict backend keeps working, but the edge lists are
+    built on every access: hot paths should use the arrays directly.
+    """
+
+    def __init__(self, width, height, node_x, node_y, offsets, targets, costs):
+        """
+        Creates a CSR graph from its arrays.
+        Args:
+            width, height: Size of the map
+            node_x, node_y: Coordinates of each node id
+            offsets: Edge offsets per node (length = nodes + 1)
+            targets: Target node id of each edge
+            costs: Cost of each edge
+        """
+        self.width = width
+        self.height = height
+        self.node_x = np.asarray(node_x, dtype=np.int32)
+        self.node_y = np.asarray(node_y, dtype=np.int32)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.targets = np.asarray(targets, dtype=np.int32)
+        self.costs = np.asarray(costs, dtype=np.int32)
+
+        self.id_grid = np.full((width, height), -1, dtype=np.int32)
+        self.id_grid[self.node_x, self.node_y] = np.arange(len(self.node_x), dtype=np.int32)
+
+        # Aristas agregadas que todavía no se integran a los arreglos
+        self.pending_edges = []
+
+    @classmethod
+    def from_edges(cls, width, height, node_x, node_y, sources, targets, costs):
+        """
+        Build the graph from edge arrays. Edges of the same source keep the
+        order they have in the arrays.
+        """
+        order = np.argsort(sources, kind="stable")
+        counts = np.bincount(np.asarray(sources)[order], minlength=len(node_x))
+        offsets = np.zeros(len(node_x) + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        return cls(width, height, node_x, node_y, offsets,
+                   np.asarray(targets)[order], np.asarray(costs)[order])
+
+    @classmethod
+    def from_dict(cls, graph, width, height):
+        """Convert a dict graph {pos: [(next_pos, cost), ...]} into CSR arrays"""
+        positions = list(graph.keys())
+        index = {pos: i for i, pos in enumerate(positions)}
+
+        offsets = np.zeros(len(positions) + 1, dtype=np.int64)
+        targets = []
+        costs = []
+        for i, pos in enumerate(positions):
+            for next_pos, cost in graph[pos]:
+                targets.append(index[next_pos])
+                costs.append(cost)
+            offsets[i + 1] = len(targets)
+
+        node_x = [pos[0] for pos in positions]
+        node_y = [pos[1] for pos in positions]
+        return cls(width, height, node_x, node_y, offsets, targets, costs)
+
+    @property
+    def num_nodes(self):
+        return len(self.node_x)
+
+    @property
+    def num_edges(self):
+        self.flush()
+        return len(self.targets)
+
+    @property
+    def nbytes(self):
+        """Memory used by the arrays"""
+        return sum(a.nbytes for a in (self.node_x, self.node_y, self.offsets,
+                                      self.targets, self.costs, self.id_grid))
+
+    def node_id(self, pos):
+        """Id of the node at pos, or -1 if pos is not in the graph"""
+        x, y = pos
+        if 0 <= x < self.width and 0 <= y < self.height:
+            return int(self.id_grid[x, y])
+        return -1
+
+    def node_pos(self, node):
+        """Coordinates of a node id"""
+        return (int(self.node_x[node]), int(self.node_y[node]))
+
+    def flush(self):
+        """Merge the pending edges into the CSR arrays"""
+        if not self.pending_edges:
+            return
+        sources = np.repeat(np.arange(self.num_nodes, dtype=np.int32), np.diff(self.offsets))
+        new_sources, new_targets, new_costs = zip(*self.pending_edges)
+        self.pending_edges = []
+
+        rebuilt = CSRGraph.from_edges(
+            self.width, self.height, self.node_x, self.node_y,
+            np.concatenate([sources, np.asarray(new_sources, dtype=np.int32)]),
+            np.concatenate([self.targets, np.asarray(new_targets, dtype=np.int32)]),
+            np.concatenate([self.costs, np.asarray(new_costs, dtype=np.int32)]),
+        )
+        self.offsets, self.targets, self.costs = rebuilt.offsets, rebuilt.targets, rebuilt.costs
+
+    def add_edge(self, from_pos, to_pos, cost):
+        """Add an edge. Both positions must already be nodes of the graph."""
+        from_id = self.node_id(from_pos)
+        to_id = self.node_id(to_pos)
+        if from_id < 0 or to_id < 0:
+            raise KeyError(f"Edge {from_pos} -> {to_pos} has a position outside the graph")
+        self.pending_edges.append((from_id, to_id, cost))
+
+    def set_edge(self, from_pos, to_pos, cost):
+        """
+        Change the cost of an edge, adding it if it does not exist.
+        A cost of None removes the edge. Returns the old cost (None if new).
+        """
+        self.flush()
+        from_id = self.node_id(from_pos)
+        to_id = self.node_id(to_pos)
+        if from_id < 0 or to_id < 0:
+            raise KeyError(f"Edge {from_pos} -> {to_pos} has a position outside the graph")
+
+        start, end = self.offsets[from_id], self.offsets[from_id + 1]
+        matches = np.nonzero(self.targets[start:end] == to_id)[0]
+        if len(matches) == 0:
+            if cost is not None:
+                self.add_edge(from_pos, to_pos, cost)
+            return None
+
+        edge = start + matches[0]
+        old_cost = int(self.costs[edge])
+        if cost is None:
+            self.targets = np.delete(self.targets, edge)
+            self.costs = np.delete(self.costs, edge)
+            self.offsets[from_id + 1:] -= 1
+        else:
+            self.costs[edge] = cost
+        return old_cost
+
+    def to_dict(self):
+        """Convert into the dict graph {pos: [(next_pos, cost), ...]}"""
+        self.flush()
+        xs, ys = self.node_x.tolist(), self.node_y.tolist()
+        offsets, targets, costs = self.offsets.tolist(), self.targets.tolist(), self.costs.tolist()
+        return {
+            (xs[i], ys[i]): [
+                ((xs[target], ys[target]), cost)
+                for target, cost in zip(targets[offsets[i]:offsets[i + 1]], costs[offsets[i]:offsets[i + 1]])
+            ]
+            for i in range(len(xs))
+        }
+
+    # Interfaz de diccionario compatible con el grafo original
+
+    def __getitem__(self, pos):
+        node = self.node_id(pos)
+        if node < 0:
+            raise KeyError(pos)
+        self.flush()
+        start, end = self.offsets[node], self.offsets[node + 1]
+        return [
+            ((x, y), cost)
+            for x, y, cost in zip(self.node_x[self.targets[start:end]].tolist(),
+                                  self.node_y[self.targets[start:end]].tolist(),
+                                  self.costs[start:end].tolist())
+        ]
+
+    def __contains__(self, pos):
+        try:
+            return self.node_id(pos) >= 0
+        except (TypeError, ValueError):
+            return False
+
+    def __iter__(self):
+        return zip(self.node_x.tolist(), self.node_y.tolist())
+
+    def __len__(self):
+        return self.num_nodes
@@ -0,0 +1,101 @@
+# Run a CityModel without the web stack and report its throughput:
+# steps per second, wall time per phase and peak memory.
+#
+#   python -m traffic_base.headless --map city_files/new_map.txt --agents 1000 --spawn-time 1 --steps 500 [--json out.json]
+
+import argparse
+import json
+import platform
+import sys
+import time
+
+# resource no existe en Windows: sin él no se reporta la memoria pico
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from .model import CityModel
+
+def peak_memory_mb():
+    """Peak resident memory of the process in MB (None where resource is not available)"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux lo reporta en KB, macOS en bytes
+    return peak / (1024 * 1024) if platform.system() == "Darwin" else peak / 1024
+
+def run(map_file, agents, spawn_time, seed, steps, graph_backend="dict", collect_every=1):
+    """Build and run one model; returns the report as a dictionary"""
+    start = time.perf_counter()
+    model = CityModel(N=agents, spawn_time=spawn_time, seed=seed, map_file=map_file, graph_backend=graph_backend,
+                      collect_every=collect_every, instrumentation=True)
+    setup_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(steps):
+        model.step()
+    run_time = time.perf_counter() - start
+
+    return {
+        "map": map_file,
+        "agents": agents,
+        "spawn_time": spawn_time,
+        "seed": seed,
+        "steps": steps,
+        "graph_backend": graph_backend,
+        "collect_every": collect_every,
+        "setup_seconds": setup_time,
+        "run_seconds": run_time,
+        "steps_per_second": steps / run_time if run_time else float("inf"),
+        "phases": model.instrumentation.phases(),
+        "counters": model.instrumentation.counters(),
+        "peak_memory_mb": peak_memory_mb(),
+        "cars_spawned": model.cars_spawned,
+        "total_arrived": model.total_arrived,
+        "trips": model.trip_log.summary(),
+    }
+
+def print_report(report):
+    print(f"Map: {report['map']}  agents: {report['agents']}  spawn time: {report['spawn_time']}  "
+          f"seed: {report['seed']}  backend: {report['graph_backend']}")
+    print(f"Setup: {report['setup_seconds']:.3f} s")
+    print(f"Run: {report['steps']} steps in {report['run_seconds']:.3f} s ({report['steps_per_second']:.1f} steps/s)")
+    print(f"\n{'phase':<18}{'seconds':>10}{'share':>8}{'calls':>10}")
+    for phase, values in report["phases"].items():
+        share = values["seconds"] / report["run_seconds"] if report["run_seconds"] else 0
+        print(f"{phase:<18}{values['seconds']:>10.3f}{share:>8.1%}{values['calls']:>10}")
+    if report["peak_memory_mb"] is not None:
+        print(f"\nPeak memory: {report['peak_memory_mb']:.1f} MB")
+    print(f"Cars spawned: {report['cars_spawned']}  arrived: {report['total_arrived']}")
+    print("Counters: " + "  ".join(f"{name}: {value}" for name, value in report["counters"].items()
+                                   if name not in ("steps", "cars_spawned", "cars_arrived")))
+    trips = report["trips"]
+    if trips["arrived"]:
+        print(f"Trips: {trips['mean_travel_steps']:.1f} steps, {trips['mean_red_light_waits']:.2f} red light waits, "
+              f"{trips['mean_car_blocks']:.2f} car blocks, {trips['mean_reroutes']:.2f} reroutes (mean per arrived trip)")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the traffic simulation without frontends")
+    parser.add_argument("--map", default="city_files/new_map.txt")
+    parser.add_argument("--agents", type=int, default=1000)
+    parser.add_argument("--spawn-time", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--steps", type=int, default=500)
+    parser.add_argument("--graph-backend", choices=["dict", "csr"], default="dict")
+    parser.add_argument("--collect-every", type=int, default=1, help="Steps between datacollector samples")
+    parser.add_argument("--json", help="Write the report as JSON to this file ('-' for stdout)")
+    args = parser.parse_args(argv)
+
+    report = run(args.map, args.agents, args.spawn_time, args.seed, args.steps, args.graph_backend, args.collect_every)
+    if args.json == "-":
+        json.dump(report, sys.stdout, indent=2)
+        print()
+        return
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
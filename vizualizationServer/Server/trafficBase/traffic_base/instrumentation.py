@@ -0,0 +1,137 @@
+import functools
+import time
+
+from .agent import Car
+
+# Fases del step que se miden (tiempo exclusivo: sin las fases anidadas)
+PHASES = ["spawn", "pathfinding", "lights", "agent_step", "data_collection"]
+
+class Instrumentation:
+    """
+    Per-model timers and counters of the hot paths.
+
+    Counters are read from the state the model already keeps (pathfinder
+    expansions, route cache, car telemetry and trip log), so they cost
+    nothing while the model runs. Phase timers are optional: enable() wraps
+    the model methods of each phase on the instance, so a model without
+    timers runs the plain methods. Each phase counts its wall time without
+    the phases nested in it (pathfinding during spawn counts as pathfinding).
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.enabled = False
+        self.totals = {}
+        self.calls = {}
+        self.stack = []  # [phase, inicio, tiempo de las fases anidadas]
+
+    def wrap(self, phase, function):
+        """function timed as phase"""
+        @functools.wraps(function)
+        def timed(*args, **kwargs):
+            self.stack.append([phase, time.perf_counter(), 0.0])
+            try:
+                return function(*args, **kwargs)
+            finally:
+                name, start, nested = self.stack.pop()
+                elapsed = time.perf_counter() - start
+                self.totals[name] = self.totals.get(name, 0.0) + elapsed - nested
+                self.calls[name] = self.calls.get(name, 0) + 1
+                if self.stack:
+                    self.stack[-1][2] += elapsed
+        return timed
+
+    def enable(self):
+        """Start timing the phases of model.step"""
+        if self.enabled:
+            return
+        self.enabled = True
+        model = self.model
+        model.spawn_car = self.wrap("spawn", model.spawn_car)
+        model.get_route = self.wrap("pathfinding", model.get_route)
+        model.get_reroute = self.wrap("pathfinding", model.get_reroute)
+        model.light_scheduler.advance = self.wrap("lights", model.light_scheduler.advance)
+        model.datacollector.collect = self.wrap("data_collection", model.datacollector.collect)
+        # Lo que queda del step fuera de las otras fases es el step de los carros
+        model.step = self.wrap("agent_step", model.step)
+
+    def phases(self):
+        """{phase: {"seconds", "calls"}} of the timed phases"""
+        return {
+            phase: {"seconds": self.totals.get(phase, 0.0), "calls": self.calls.get(phase, 0)}
+            for phase in PHASES
+        }
+
+    def counters(self):
+        """Cumulative counters of the model"""
+        model = self.model
+        # Los viajes terminados están en el trip log; los activos, en los carros
+        trip_totals = dict(model.trip_log.totals)
+        for car in model.agents_by_type.get(Car, []):
+            trip_totals["red_light_waits"] += car.red_light_waits
+            trip_totals["car_blocks"] += car.car_blocks
+            trip_totals["reroutes"] += car.reroutes
+
+        cache = model.route_cache.stats()
+        return {
+            "steps": model.steps,
+            "cars_spawned": model.cars_spawned,
+            "cars_arrived": model.total_arrived,
+            "astar_expansions": model.pathfinder.expanded + model.congestion_router.expanded,
+            "routing_tables_built": model.routing.tables_built,
+            "reroutes": trip_totals["reroutes"],
+            "reroute_fallbacks": model.congestion_router.fallbacks,
+            "blocked_by_car": trip_totals["car_blocks"],
+            "blocked_by_red_light": trip_totals["red_light_waits"],
+            "route_cache_hits": cache["hits"],
+            "route_cache_misses": cache["misses"],
+            "route_cache_evictions": cache["evictions"],
+        }
+
+    def gauges(self):
+        """Current values of the model"""
+        return {
+            "active_cars": self.model.count_active_cars(self.model),
+            "route_cache_size": len(self.model.route_cache.routes),
+        }
+
+    def snapshot(self):
+        return {"counters": self.counters(), "gauges": self.gauges(), "phases": self.phases()}
+
+def escape_label(value):
+    """Label value escaped for the Prometheus text format (backslash, double quote and newline)"""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def prometheus_text(snapshots, prefix="traffic"):
+    """
+    Prometheus text format of several snapshots, as [(labels, snapshot)]
+    (labels: {name: value}, e.g. the session of each model).
+    """
+    lines = []
+
+    def label_text(labels):
+        if not labels:
+            return ""
+        return "{" + ",".join(f'{name}="{escape_label(value)}"' for name, value in labels.items()) + "}"
+
+    def family(name, kind, help_text, samples):
+        lines.append(f"# HELP {prefix}_{name} {help_text}")
+        lines.append(f"# TYPE {prefix}_{name} {kind}")
+        for labels, value in samples:
+            lines.append(f"{prefix}_{name}{label_text(labels)} {value}")
+
+    if not snapshots:
+        return ""
+    for name in snapshots[0][1]["counters"]:
+        family(f"{name}_total", "counter", f"Cumulative {name.replace('_', ' ')}",
+               [(labels, snapshot["counters"][name]) for labels, snapshot in snapshots])
+    for name in snapshots[0][1]["gauges"]:
+        family(name, "gauge", name.replace("_", " ").capitalize(),
+               [(labels, snapshot["gauges"][name]) for labels, snapshot in snapshots])
+    family("phase_seconds_total", "counter", "Wall time of each step phase (exclusive of nested phases)",
+           [(dict(labels, phase=phase), values["seconds"])
+            for labels, snapshot in snapshots for phase, values in snapshot["phases"].items()])
+    family("phase_calls_total", "counter", "Calls of each step phase",
+           [(dict(labels, phase=phase), values["calls"])
+            for labels, snapshot in snapshots for phase, values in snapshot["phases"].items()])
+    return "\n".join(lines) + "\n"
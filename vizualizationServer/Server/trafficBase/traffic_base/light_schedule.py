@@ -0,0 +1,60 @@
+import heapq
+
+class LightScheduler:
+    """
+    Event-driven scheduler for the traffic lights of a CityModel.
+
+    Lights are grouped by their period (timeToChange) and a heap keeps the
+    next step at which each group changes, so a step only touches the lights
+    that actually change. A light changes at every step multiple of its
+    period, exactly like Traffic_Light.step did, so the state of any light at
+    any step can also be computed without simulating (state_at).
+    """
+
+    def __init__(self, lights):
+        """
+        Creates the scheduler.
+        Args:
+            lights: Traffic_Light agents, in the model order (light id)
+        """
+        self.lights = list(lights)
+        self.initial_states = [light.state for light in self.lights]
+        self.periods = [light.timeToChange for light in self.lights]
+
+        # Grupos de semáforos por periodo y heap de (siguiente cambio, periodo)
+        self.groups = {}
+        for light, period in enumerate(self.periods):
+            self.groups.setdefault(period, []).append(light)
+        self.events = [(period, period) for period in self.groups]
+        heapq.heapify(self.events)
+
+    def advance(self, step):
+        """
+        Change the lights scheduled up to step (model.steps).
+        Returns the ids of the lights that changed.
+        """
+        changed = []
+        while self.events and self.events[0][0] <= step:
+            _, period = heapq.heappop(self.events)
+            # El estado se calcula en lugar de invertirse, así que también es
+            # correcto si se saltaron steps
+            for light in self.groups[period]:
+                self.lights[light].state = self.state_at(light, step)
+            changed.extend(self.groups[period])
+            next_step = (step // period + 1) * period
+            heapq.heappush(self.events, (next_step, period))
+        return changed
+
+    def state_at(self, light, step):
+        """State (True = green) of a light after the given step"""
+        flips = step // self.periods[light]
+        return self.initial_states[light] != (flips % 2 == 1)
+
+    def states_at(self, step):
+        """State of every light after the given step"""
+        return [self.state_at(light, step) for light in range(len(self.lights))]
+
+    def next_change(self, light, step):
+        """First step after the given step at which the light changes"""
+        period = self.periods[light]
+        return (step // period + 1) * period
@@ -0,0 +1,279 @@
+from collections.abc import Mapping
+import json
+import os
+import numpy as np
+
+from .csr_graph import CSRGraph
+
+# Tipos de celda de la capa cell_type
+CELL_EMPTY = 0
+CELL_ROAD = 1
+CELL_TRAFFIC_LIGHT = 2
+CELL_OBSTACLE = 3
+CELL_DESTINATION = 4
+
+ROAD_SYMBOLS = "v^><ABCEFGHJ"
+TRAFFIC_LIGHT_SYMBOLS = "rRlLuUdW"
+
+# Direcciones permitidas por símbolo para el grafo (en el orden en que se agregan las aristas)
+GRAPH_DIRECTIONS = {
+    ">": ["Right"],
+    "<": ["Left"],
+    "v": ["Down"],
+    "^": ["Up"],
+    "A": ["Up", "Right"],
+    "B": ["Up", "Left"],
+    "C": ["Down", "Right"],
+    "E": ["Down", "Left"],
+    "F": ["Right", "Up"],
+    "G": ["Right", "Down"],
+    "H": ["Left", "Up"],
+    "J": ["Left", "Down"],
+    "r": ["Right"],
+    "R": ["Right"],
+    "l": ["Left"],
+    "L": ["Left"],
+    "u": ["Up"],
+    "U": ["Up"],
+    "d": ["Down"],
+    "W": ["Down"],
+    "D": ["Up", "Down", "Left", "Right"],  # Destinations allow all directions
+}
+
+DIRECTIONS = ["Up", "Down", "Left", "Right"]
+DIRECTION_OFFSETS = {"Up": (0, 1), "Down": (0, -1), "Left": (-1, 0), "Right": (1, 0)}
+DIRECTION_BITS = {"Up": 1, "Down": 2, "Left": 4, "Right": 8}
+
+# Costo extra al entrar o salir de un semáforo
+TRAFFIC_LIGHT_COST = {
+    "r": 3, "l": 3, "u": 3, "d": 3,  # Semáforos cortos
+    "R": 5, "L": 5, "U": 5, "W": 5   # Semáforos largos
+}
+
+MAX_SLOTS = max(len(directions) for directions in GRAPH_DIRECTIONS.values())
+
+def _symbol_table(values, default, dtype):
+    """256-entry lookup table indexed by the ASCII code of a symbol"""
+    table = np.full(256, default, dtype=dtype)
+    for symbol, value in values.items():
+        table[ord(symbol)] = value
+    return table
+
+class CityMap:
+    """
+    Static layers of a city map, stored as NumPy arrays indexed [x, y]
+    (y = 0 is the last line of the file, as in the mesa grid).
+
+    Layers:
+        symbols: ASCII code of the map symbol
+        cell_type: CELL_* constant
+        directions: Bit mask of the allowed movements (DIRECTION_BITS)
+        light_id: Index of the traffic light in the cell (-1 if none)
+    """
+
+    def __init__(self, rows, dictionary):
+        """
+        Creates the layers.
+        Args:
+            rows: uint8 array (height, width) with the symbols, first line first
+            dictionary: Content of mapDictionary.json
+        """
+        self.dictionary = dictionary
+        self.height, self.width = rows.shape
+
+        types = {symbol: CELL_ROAD for symbol in ROAD_SYMBOLS}
+        types.update({symbol: CELL_TRAFFIC_LIGHT for symbol in TRAFFIC_LIGHT_SYMBOLS})
+        types.update({"#": CELL_OBSTACLE, "D": CELL_DESTINATION})
+        bits = {symbol: sum(DIRECTION_BITS[d] for d in directions)
+                for symbol, directions in GRAPH_DIRECTIONS.items()}
+
+        # Capas en orden de archivo (fila, columna) y después en coordenadas [x, y]
+        cell_type_rows = _symbol_table(types, CELL_EMPTY, np.uint8)[rows]
+        self.symbols = np.ascontiguousarray(rows[::-1].T)
+        self.cell_type = np.ascontiguousarray(cell_type_rows[::-1].T)
+        self.directions = _symbol_table(bits, 0, np.uint8)[self.symbols]
+
+        # Semáforos numerados en orden de lectura del archivo
+        light_rows, light_cols = np.nonzero(cell_type_rows == CELL_TRAFFIC_LIGHT)
+        self.light_x = light_cols.astype(np.int32)
+        self.light_y = (self.height - 1 - light_rows).astype(np.int32)
+        self.light_id = np.full((self.width, self.height), -1, dtype=np.int32)
+        self.light_id[self.light_x, self.light_y] = np.arange(len(self.light_x), dtype=np.int32)
+
+        # Dirección de la carretera como la reportan los agentes Road / Traffic_Light
+        self.road_directions = {}
+        for symbol in ROAD_SYMBOLS + TRAFFIC_LIGHT_SYMBOLS:
+            value = dictionary[symbol]
+            if symbol in "v^><":
+                self.road_directions[symbol] = value
+            elif symbol in TRAFFIC_LIGHT_SYMBOLS:
+                self.road_directions[symbol] = value[0]
+            else:
+                self.road_directions[symbol] = (value[0], value[1])
+
+        # Capas planas (listas de Python) para consultas O(1) desde los agentes.
+        # Índice de la celda (x, y): x * height + y
+        self.flat_cell_type = self.cell_type.ravel().tolist()
+        self.flat_light_id = self.light_id.ravel().tolist()
+        self.flat_road_direction = [self.road_directions.get(chr(code)) for code in self.symbols.ravel().tolist()]
+
+        self.map_grid = MapGridView(self)
+
+    def in_bounds(self, pos):
+        x, y = pos
+        return 0 <= x < self.width and 0 <= y < self.height
+
+    def flat_index(self, pos):
+        """Index of pos in the flat layers"""
+        return pos[0] * self.height + pos[1]
+
+    def symbol_at(self, pos):
+        """Map symbol at pos"""
+        return chr(self.symbols[pos])
+
+    def type_at(self, pos):
+        """CELL_* type at pos (obstacle outside the map)"""
+        if not self.in_bounds(pos):
+            return CELL_OBSTACLE
+        return self.flat_cell_type[pos[0] * self.height + pos[1]]
+
+    def is_obstacle(self, pos):
+        return self.type_at(pos) == CELL_OBSTACLE
+
+    def is_drivable(self, pos):
+        """Road, traffic light or destination"""
+        return self.type_at(pos) in (CELL_ROAD, CELL_TRAFFIC_LIGHT, CELL_DESTINATION)
+
+    def road_direction(self, pos):
+        """
+        Direction of the road at pos: a string, a tuple for intersections,
+        or None if the cell is not a road or a traffic light.
+        """
+        if not self.in_bounds(pos):
+            return None
+        return self.flat_road_direction[pos[0] * self.height + pos[1]]
+
+    def light_id_at(self, pos):
+        """Index of the traffic light at pos (-1 if none)"""
+        if not self.in_bounds(pos):
+            return -1
+        return self.flat_light_id[pos[0] * self.height + pos[1]]
+
+    def light_duration(self, light):
+        """Steps between changes of a traffic light"""
+        return self.dictionary[self.symbol_at((self.light_x[light], self.light_y[light]))][1]
+
+    def positions_of(self, cell_type):
+        """Positions of a cell type in file order (top line first)"""
+        xs, ys = self.file_order_nonzero(self.cell_type == cell_type)
+        return list(zip(xs.tolist(), ys.tolist()))
+
+    def file_order_nonzero(self, mask):
+        """x and y of the True cells of an [x, y] mask, in file order"""
+        rows, cols = np.nonzero(mask.T[::-1])
+        return cols, self.height - 1 - rows
+
+class MapGridView(Mapping):
+    """
+    Read-only {(x, y): symbol} view of a CityMap, with the same keys and
+    iteration order as the map_grid dict the model used to build.
+    """
+
+    def __init__(self, city_map):
+        self.city_map = city_map
+
+    def __getitem__(self, pos):
+        try:
+            if self.city_map.in_bounds(pos):
+                return chr(self.city_map.symbols[pos])
+        except (TypeError, ValueError):
+            pass
+        raise KeyError(pos)
+
+    def __iter__(self):
+        for y in range(self.city_map.height - 1, -1, -1):
+            for x in range(self.city_map.width):
+                yield (x, y)
+
+    def __len__(self):
+        return self.city_map.width * self.city_map.height
+
+    def items(self):
+        symbols = self.city_map.symbols
+        for y in range(self.city_map.height - 1, -1, -1):
+            for x, code in enumerate(symbols[:, y].tolist()):
+                yield (x, y), chr(code)
+
+# Directorio de trafficBase: las rutas relativas (city_files/...) se buscan aquí si no existen
+# desde el directorio de trabajo, así el modelo se puede usar desde cualquier directorio
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def resolve_path(path):
+    """Path as given if it exists (absolute or from the working directory), otherwise relative to PACKAGE_DIR"""
+    if os.path.isabs(path) or os.path.exists(path):
+        return path
+    return os.path.join(PACKAGE_DIR, path)
+
+def load_city_map(map_file, dictionary_file="city_files/mapDictionary.json"):
+    """Parse a map file into a CityMap"""
+    with open(resolve_path(dictionary_file)) as f:
+        dictionary = json.load(f)
+
+    with open(resolve_path(map_file)) as baseFile:
+        lines = [line.strip() for line in baseFile.readlines() if line.strip()]
+
+    width = len(lines[0])
+    # Las líneas más cortas se completan con obstáculos
+    lines = [line[:width].ljust(width, "#") for line in lines]
+    rows = np.frombuffer("".join(lines).encode("ascii", errors="replace"), dtype=np.uint8)
+    return CityMap(rows.reshape(len(lines), width), dictionary)
+
+def build_csr_graph(city_map):
+    """
+    Build the directional graph straight from the map layers.
+    Nodes are the non-obstacle cells in file order and the edges of each node
+    follow GRAPH_DIRECTIONS, so the result matches the graph built cell by cell.
+    """
+    width, height = city_map.width, city_map.height
+    node_x, node_y = city_map.file_order_nonzero(city_map.symbols != ord("#"))
+    node_x = node_x.astype(np.int32)
+    node_y = node_y.astype(np.int32)
+
+    node_ids = np.full((width, height), -1, dtype=np.int32)
+    node_ids[node_x, node_y] = np.arange(len(node_x), dtype=np.int32)
+
+    light_cost = _symbol_table(TRAFFIC_LIGHT_COST, 0, np.int32)
+    node_symbols = city_map.symbols[node_x, node_y]
+
+    sources, targets, costs = [], [], []
+    for slot in range(MAX_SLOTS):
+        # Dirección de cada nodo en esta posición de su lista de direcciones
+        for direction in DIRECTIONS:
+            slot_symbols = [symbol for symbol, directions in GRAPH_DIRECTIONS.items()
+                            if len(directions) > slot and directions[slot] == direction]
+            if not slot_symbols:
+                continue
+            mask = np.isin(node_symbols, [ord(symbol) for symbol in slot_symbols])
+            dx, dy = DIRECTION_OFFSETS[direction]
+            next_x = node_x[mask] + dx
+            next_y = node_y[mask] + dy
+
+            inside = (next_x >= 0) & (next_x < width) & (next_y >= 0) & (next_y < height)
+            from_ids = np.nonzero(mask)[0][inside]
+            next_x, next_y = next_x[inside], next_y[inside]
+            to_ids = node_ids[next_x, next_y]
+
+            # Solo hacia celdas que no son obstáculo
+            valid = to_ids >= 0
+            from_ids, to_ids = from_ids[valid], to_ids[valid]
+            sources.append(from_ids)
+            targets.append(to_ids)
+            costs.append(1 + light_cost[node_symbols[from_ids]] + light_cost[node_symbols[to_ids]])
+
+    # The edges of each node keep the slot order (stable sort by source). Moves
+    # into destinations are already edges because adjacent cells can only reach
+    # a "D" following their own directions, the same rule add_destination_connections checks.
+    return CSRGraph.from_edges(
+        width, height, node_x, node_y,
+        np.concatenate(sources), np.concatenate(targets), np.concatenate(costs),
+    )
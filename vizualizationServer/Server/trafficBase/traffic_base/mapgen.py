@@ -0,0 +1,209 @@
+# Synthetic city maps in the symbol alphabet of city_files/mapDictionary.json, for testing the
+# model at sizes far above the hand-made maps (1000 x 1000 and beyond).
+#
+# The default destination ratio keeps the routing tables of every destination within the default
+# memory budget of RoutingTable up to 500 x 500 (a higher ratio makes CityModel fall back to A*).
+#
+#   python -m traffic_base.mapgen --width 1000 --height 1000 --block 6 --lights 0.5 --destinations 0.004 --out city_files/synthetic_1000.txt
+
+import argparse
+import json
+
+import numpy as np
+
+from .map_loader import CELL_DESTINATION, CityMap, build_csr_graph, resolve_path
+
+# Desplazamiento (fila, columna) de cada dirección en el archivo: la primera línea es y = height - 1
+FILE_OFFSETS = {"Up": (-1, 0), "Down": (1, 0), "Left": (0, -1), "Right": (0, 1)}
+ARROWS = {"Up": "^", "Down": "v", "Left": "<", "Right": ">"}
+
+# Símbolo de una celda con dos direcciones, (dirección de la calle, vuelta)
+TURNS = {
+    ("Up", "Right"): "A", ("Up", "Left"): "B", ("Down", "Right"): "C", ("Down", "Left"): "E",
+    ("Right", "Up"): "F", ("Right", "Down"): "G", ("Left", "Up"): "H", ("Left", "Down"): "J",
+}
+
+# Semáforo de cada dirección: (corto, empieza en verde), (largo, empieza en rojo)
+LIGHTS = {"Right": ("r", "R"), "Left": ("l", "L"), "Up": ("u", "U"), "Down": ("d", "W")}
+
+def road_lines(size, block):
+    """Indices of the roads across one axis: both borders plus one road every block + 1 cells"""
+    lines = list(range(0, size - 1, block + 1))
+    # La última calle interior debe dejar al menos una celda antes del borde
+    if size - 1 - lines[-1] < 2 and len(lines) > 1:
+        lines.pop()
+    return lines + [size - 1]
+
+def generate_map(width, height, block=4, light_ratio=0.5, destination_ratio=0.004, seed=None):
+    """
+    Generate a city map and return its lines (first line = top of the map).
+
+    The roads form a one-way grid: a counterclockwise ring on the border and inner
+    streets with alternating directions, joined at intersections (F, G, H, J) where
+    cars can go straight or turn. Such a grid is strongly connected, so every road
+    cell is reachable from the spawn corners. Destinations are placed next to the
+    streets and the road cell beside each one turns into it (A-J symbols); the map
+    is checked afterwards and any destination that is not reachable from every
+    spawn corner is replaced by an obstacle.
+    Args:
+        width, height: Size of the map in cells (at least 3 x 3)
+        block: Cells between parallel streets
+        light_ratio: Fraction of the inner intersections with traffic lights
+        destination_ratio: Probability of a destination in each block cell next to a street
+        seed: Seed of the random generator
+    """
+    if width < 3 or height < 3:
+        raise ValueError("The map must be at least 3 x 3")
+    if block < 1:
+        raise ValueError("block must be at least 1")
+    rng = np.random.default_rng(seed)
+
+    grid = np.full((height, width), ord("#"), dtype=np.uint8)
+    rows = road_lines(height, block)
+    cols = road_lines(width, block)
+
+    # Dirección de cada calle: anillo en sentido contrario a las manecillas, interiores alternadas
+    row_direction = {row: "Right" if i % 2 else "Left" for i, row in enumerate(rows)}
+    row_direction[rows[0]], row_direction[rows[-1]] = "Left", "Right"
+    col_direction = {col: "Up" if i % 2 else "Down" for i, col in enumerate(cols)}
+    col_direction[cols[0]], col_direction[cols[-1]] = "Down", "Up"
+
+    for row in rows:
+        grid[row, :] = ord(ARROWS[row_direction[row]])
+    for col in cols:
+        grid[:, col] = ord(ARROWS[col_direction[col]])
+
+    # Intersecciones: seguir de frente o dar vuelta (solo hacia direcciones dentro del mapa)
+    for row in rows:
+        for col in cols:
+            directions = []
+            for direction in (row_direction[row], col_direction[col]):
+                d_row, d_col = FILE_OFFSETS[direction]
+                if 0 <= row + d_row < height and 0 <= col + d_col < width:
+                    directions.append(direction)
+            if len(directions) == 2:
+                grid[row, col] = ord(TURNS[tuple(directions)])
+            else:
+                grid[row, col] = ord(ARROWS[directions[0]])
+
+    place_lights(grid, rows[1:-1], cols[1:-1], row_direction, col_direction, light_ratio, rng)
+    place_destinations(grid, rows, cols, row_direction, col_direction, destination_ratio, rng)
+
+    lines = ["".join(map(chr, line)) for line in grid.tolist()]
+    return remove_unreachable_destinations(lines)
+
+def place_lights(grid, rows, cols, row_direction, col_direction, light_ratio, rng):
+    """
+    Traffic lights on the two approaches of a fraction of the inner intersections:
+    one starts green and the other red, chosen at random.
+    """
+    arrows = {ord(symbol) for symbol in ARROWS.values()}
+    for row in rows:
+        for col in cols:
+            if rng.random() >= light_ratio:
+                continue
+            horizontal_green = rng.random() < 0.5
+            approaches = (
+                (row_direction[row], horizontal_green),
+                (col_direction[col], not horizontal_green),
+            )
+            for direction, green in approaches:
+                d_row, d_col = FILE_OFFSETS[direction]
+                # La celda anterior a la intersección en el sentido de la calle
+                approach = (row - d_row, col - d_col)
+                if grid[approach] in arrows:
+                    short, long = LIGHTS[direction]
+                    grid[approach] = ord(short if green else long)
+
+def place_destinations(grid, rows, cols, row_direction, col_direction, destination_ratio, rng):
+    """Destinations in block cells next to plain street cells, which turn into them"""
+    height, width = grid.shape
+    obstacle = ord("#")
+
+    def place(street, cells, turn_direction, street_direction):
+        # street / cells: vistas 1D de la calle y de la fila o columna de al lado
+        plain = street == ord(ARROWS[street_direction])
+        chosen = np.nonzero(plain & (cells == obstacle) & (rng.random(len(cells)) < destination_ratio))[0]
+        cells[chosen] = ord("D")
+        street[chosen] = ord(TURNS[(street_direction, turn_direction)])
+
+    for row in rows:
+        direction = row_direction[row]
+        if row > 0:
+            place(grid[row], grid[row - 1], "Up", direction)
+        if row < height - 1:
+            place(grid[row], grid[row + 1], "Down", direction)
+    for col in cols:
+        direction = col_direction[col]
+        if col > 0:
+            place(grid[:, col], grid[:, col - 1], "Left", direction)
+        if col < width - 1:
+            place(grid[:, col], grid[:, col + 1], "Right", direction)
+
+def load_dictionary(dictionary_file="city_files/mapDictionary.json"):
+    with open(resolve_path(dictionary_file)) as f:
+        return json.load(f)
+
+def reachable(graph, starts):
+    """Boolean mask of the nodes of a CSRGraph reachable from the start node ids (BFS by levels)"""
+    seen = np.zeros(graph.num_nodes, dtype=bool)
+    frontier = np.unique(np.asarray(starts, dtype=np.int64))
+    seen[frontier] = True
+    while len(frontier):
+        begin, end = graph.offsets[frontier], graph.offsets[frontier + 1]
+        counts = end - begin
+        # Índices de todas las aristas de la frontera
+        edges = np.repeat(begin - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+        nodes = np.unique(graph.targets[edges])
+        frontier = nodes[~seen[nodes]]
+        seen[frontier] = True
+    return seen
+
+def remove_unreachable_destinations(lines, dictionary=None):
+    """Replace by obstacles the destinations not reachable from every spawn corner"""
+    dictionary = dictionary or load_dictionary()
+    rows = np.frombuffer("".join(lines).encode("ascii"), dtype=np.uint8).reshape(len(lines), len(lines[0]))
+    city_map = CityMap(rows, dictionary)
+    graph = build_csr_graph(city_map)
+
+    corners = [(0, 0), (city_map.width - 1, 0), (0, city_map.height - 1), (city_map.width - 1, city_map.height - 1)]
+    reached = np.ones(graph.num_nodes, dtype=bool)
+    for corner in corners:
+        node = graph.node_id(corner)
+        if node >= 0:
+            reached &= reachable(graph, [node])
+
+    destination_ids = graph.id_grid[city_map.cell_type == CELL_DESTINATION]
+    unreachable = destination_ids[~reached[destination_ids]]
+    if not len(unreachable):
+        return lines
+
+    grid = rows.copy()
+    xs, ys = graph.node_x[unreachable], graph.node_y[unreachable]
+    grid[city_map.height - 1 - ys, xs] = ord("#")
+    return ["".join(map(chr, line)) for line in grid.tolist()]
+
+def write_map(lines, path):
+    with open(path, "w") as f:
+        f.write("\n".join(lines) + "\n")
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic city map")
+    parser.add_argument("--width", type=int, default=200)
+    parser.add_argument("--height", type=int, default=200)
+    parser.add_argument("--block", type=int, default=4, help="Cells between parallel streets")
+    parser.add_argument("--lights", type=float, default=0.5, help="Fraction of inner intersections with lights")
+    parser.add_argument("--destinations", type=float, default=0.004,
+                        help="Probability of a destination in each block cell next to a street")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out", required=True)
+    args = parser.parse_args()
+
+    lines = generate_map(args.width, args.height, args.block, args.lights, args.destinations, args.seed)
+    write_map(lines, args.out)
+    text = "".join(lines)
+    print(f"{args.width} x {args.height} map -> {args.out}: "
+          f"{sum(text.count(s) for s in 'rRlLuUdW')} traffic lights, {text.count('D')} destinations")
+
+if __name__ == "__main__":
+    main()
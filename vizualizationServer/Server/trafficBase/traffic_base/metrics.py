@@ -0,0 +1,113 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+class MetricsSink:
+    """
+    Memory-bounded replacement of mesa.DataCollector for the model reporters.
+
+    Each sample is written in a preallocated NumPy ring buffer (one row per
+    metric), so memory does not grow with the run. With flush_dir the rows
+    are also written to disk in .npz chunks of chunk_size samples while the
+    simulation runs. tail() returns a recent window without touching the rest
+    of the history, and get_model_vars_dataframe() keeps the DataCollector
+    interface used by Solara, the sweeps and the benchmarks.
+    """
+
+    def __init__(self, model_reporters, capacity=10000, flush_dir=None, chunk_size=None, prefix="metrics"):
+        """
+        Creates the sink.
+        Args:
+            model_reporters: {name: function(model) or model attribute name}, as in mesa.DataCollector
+            capacity: Samples kept in memory (the oldest ones are overwritten)
+            flush_dir: Directory of the .npz chunks (None = keep only the ring buffer)
+            chunk_size: Samples per chunk (default: half the capacity)
+            prefix: File name prefix of the chunks
+        """
+        self.names = list(model_reporters)
+        self.reporters = [
+            reporter if callable(reporter) else (lambda model, attribute=reporter: getattr(model, attribute))
+            for reporter in model_reporters.values()
+        ]
+        self.capacity = capacity
+        self.values = np.zeros((len(self.names), capacity), dtype=np.float64)
+        self.steps = np.zeros(capacity, dtype=np.int64)
+        self.count = 0  # Muestras recolectadas desde el inicio
+
+        self.flush_dir = flush_dir
+        self.prefix = prefix
+        self.chunk_size = min(chunk_size or max(capacity // 2, 1), capacity)
+        self.flushed = 0  # Muestras ya escritas a disco
+        self.chunk_paths = []
+        if flush_dir is not None:
+            os.makedirs(flush_dir, exist_ok=True)
+
+    def collect(self, model):
+        """Sample every reporter (same call as DataCollector.collect)"""
+        slot = self.count % self.capacity
+        for row, reporter in enumerate(self.reporters):
+            self.values[row, slot] = reporter(model)
+        self.steps[slot] = model.steps
+        self.count += 1
+
+        # Las muestras sin escribir nunca se sobreescriben: chunk_size <= capacity
+        if self.flush_dir is not None and self.count - self.flushed >= self.chunk_size:
+            self.flush()
+
+    def __len__(self):
+        """Samples currently kept in memory"""
+        return min(self.count, self.capacity)
+
+    def window(self, start, end):
+        """Slots of the ring buffer of the samples [start, end), in order"""
+        return np.arange(start, end) % self.capacity
+
+    def tail(self, n=None, names=None):
+        """
+        The last n samples (all the kept ones by default) as {"step": array, name: array}.
+        Only the requested window is copied.
+        """
+        kept = len(self)
+        n = kept if n is None else max(min(n, kept), 0)
+        slots = self.window(self.count - n, self.count)
+        names = self.names if names is None else names
+        result = {"step": self.steps[slots]}
+        for name in names:
+            result[name] = self.values[self.names.index(name), slots]
+        return result
+
+    def flush(self):
+        """Write the samples not yet on disk as one .npz chunk"""
+        if self.flush_dir is None or self.flushed == self.count:
+            return None
+        slots = self.window(self.flushed, self.count)
+        columns = {"step": self.steps[slots]}
+        for row, name in enumerate(self.names):
+            columns[name] = self.values[row, slots]
+
+        path = os.path.join(self.flush_dir, f"{self.prefix}_{len(self.chunk_paths):05d}.npz")
+        np.savez(path, **columns)
+        self.chunk_paths.append(path)
+        self.flushed = self.count
+        return path
+
+    def history(self):
+        """
+        Every sample as {"step": array, name: array}: the chunks on disk plus the
+        samples still in memory. Without flush_dir, only the samples kept in memory.
+        """
+        if self.flush_dir is None:
+            return self.tail()
+
+        parts = []
+        for path in self.chunk_paths:
+            with np.load(path) as chunk:
+                parts.append({name: chunk[name] for name in chunk.files})
+        parts.append(self.tail(self.count - self.flushed))
+        return {name: np.concatenate([part[name] for part in parts]) for name in ["step"] + self.names}
+
+    def get_model_vars_dataframe(self):
+        """Samples as a DataFrame with one column per reporter (DataCollector interface)"""
+        columns = self.history()
+        return pd.DataFrame({name: columns[name] for name in self.names})
@@ -1,28 +1,93 @@
-import mesa
 from mesa import Model
 from mesa.discrete_space import OrthogonalMooreGrid
 from .agent import *
-import json
-import random
+from .csr_graph import CSRGraph
+from .instrumentation import Instrumentation
+from .light_schedule import LightScheduler
+from .map_loader import CELL_DESTINATION, CELL_OBSTACLE, CELL_ROAD, build_csr_graph, load_city_map
+from .metrics import MetricsSink
+from .pathfinding import AStarPathfinder
+from .replanning import CongestionRouter
+from .routing import RoutingTable
+from .tracking import CarTracker, OccupancyIndex
+from .trips import TripLog
+from collections import OrderedDict
 import math
 
+# Backends del grafo direccional: "dict" {pos: [(next_pos, cost)]} o "csr" (CSRGraph)
+GRAPH_BACKENDS = ("dict", "csr")
+
+class RouteCache:
+    """
+    Bounded cache of routes with LRU eviction.
+
+    Keys are (origin, destination, graph version), so routes computed before
+    a cost change are never returned again; they are evicted as they age.
+    Routes are stored as tuples and shared by every car that asks for them.
+    """
+
+    def __init__(self, max_size=4096):
+        self.max_size = max_size
+        self.routes = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """Return (found, route) and mark the entry as recently used"""
+        if key in self.routes:
+            self.routes.move_to_end(key)
+            self.hits += 1
+            return True, self.routes[key]
+        self.misses += 1
+        return False, None
+
+    def put(self, key, route):
+        """Store a route (None for unreachable) and evict the least recently used entry"""
+        self.routes[key] = route
+        self.routes.move_to_end(key)
+        while len(self.routes) > self.max_size:
+            self.routes.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        self.routes.clear()
+
+    def stats(self):
+        """Counters of the cache"""
+        total = self.hits + self.misses
+        return {
+            "size": len(self.routes),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
 class CityModel(Model):
     """
     Creates a model based on a city map with directional roads.
     """
     
-    def __init__(self, N=10000, spawn_time=10, seed=42):
+    def __init__(self, N=10000, spawn_time=10, seed=42, map_file="city_files/new_map.txt", graph_backend="dict",
+                 lazy_agents=True, route_cache_size=4096, routing_tables=None, routing_max_destinations=None,
+                 routing_memory_mb=512,
+                 congestion_rerouting=False, collect_every=1, metrics_capacity=10000, metrics_dir=None,
+                 trip_batch_size=4096, trip_dir=None, instrumentation=False):
         super().__init__(seed=seed)
         
-        # Load the map dictionary
-        dataDictionary = json.load(open("city_files/mapDictionary.json"))
-        
         ## Variables
         # self.num_agents = N
         self.traffic_lights = []
         self.cars_spawned = 0 # Cantidad de carros spawneados
         self.steps_count = 0 # Cantidad de steps de la simulación
         self.total_arrived = 0 # Total acumulado
+        self._arrived_this_step = 0 # Llegadas desde la última recolección
+        self.active_moves = 0 # Suma de los movimientos de los carros activos
+        self.total_moves = 0 # Movimientos acumulados de todos los carros
+        # Steps entre recolecciones del datacollector (1 = cada step)
+        self.collect_every = max(int(collect_every), 1)
         
         if hasattr(N, 'value'):
             self.num_agents = N.value
@@ -34,68 +99,71 @@ class CityModel(Model):
         else:
             self.spawn_time = int(spawn_time)
 
+        # "dict": {pos: [(next_pos, cost)]}, "csr": CSRGraph con arreglos de NumPy
+        if graph_backend not in GRAPH_BACKENDS:
+            raise ValueError(f"Unknown graph backend: {graph_backend}")
+        self.graph_backend = graph_backend
+
         
-        # Load the map file
-        with open("city_files/new_map.txt") as baseFile:
-            lines = baseFile.readlines()
-            lines = [line.strip() for line in lines if line.strip()]
-            
-            self.width = len(lines[0])
-            self.height = len(lines)
-            
-            self.grid = OrthogonalMooreGrid(
-                [self.width, self.height], capacity=100, torus=False, random=self.random
-            )
-            
-            # Store map characters for graph creation
-            self.map_grid = {}
-
-            # Se usa un diccionario para guardar los estados de la simulación (métricas de desempeño)
-            self.datacollector = mesa.DataCollector(
-                {
-                    "Active_cars": lambda m: self.count_active_cars(m),
-                    "Arrived_per_step": lambda m: self.count_arrived_this_step(m),
-                    "Total_arrived": lambda m: m.total_arrived,
-                    "Total_spawned": lambda m: m.cars_spawned,
-                    "Average_moves": lambda m: self.average_moves(m),
-                }
+        # Load the map file into NumPy layers (tipo de celda, direcciones, semáforos)
+        self.city_map = load_city_map(map_file)
+        self.width = self.city_map.width
+        self.height = self.city_map.height
+
+        self.grid = OrthogonalMooreGrid(
+            [self.width, self.height], capacity=100, torus=False, random=self.random
+        )
+
+        # Map characters for graph creation (vista sobre las capas)
+        self.map_grid = self.city_map.map_grid
+
+        # Se usa un diccionario para guardar los estados de la simulación (métricas de desempeño).
+        # Las métricas leen contadores que los carros actualizan al aparecer, moverse y llegar: O(1) por métrica
+        # MetricsSink guarda las series en un buffer circular de NumPy (metrics_capacity muestras)
+        # y con metrics_dir las escribe a disco por chunks .npz mientras corre la simulación
+        self.datacollector = MetricsSink(
+            {
+                "Active_cars": lambda m: self.count_active_cars(m),
+                "Arrived_per_step": lambda m: self.count_arrived_this_step(m),
+                "Total_arrived": lambda m: m.total_arrived,
+                "Total_spawned": lambda m: m.cars_spawned,
+                "Average_moves": lambda m: self.average_moves(m),
+            },
+            capacity=metrics_capacity,
+            flush_dir=metrics_dir,
+        )
+
+        # Índice espacial de los carros: carros por celda (x * height + y) y posición de cada carro.
+        # Lo actualiza el tracker cada vez que un carro aparece, cambia de celda o sale.
+        self.occupancy_index = OccupancyIndex(self.width, self.height)
+
+        # Diario de cambios de posición por step (para /getCars?since=)
+        self.car_tracker = CarTracker(self, self.occupancy_index)
+
+        # Un registro por viaje terminado (tiempos, esperas, recálculos), por batches de trip_batch_size
+        self.trip_log = TripLog(trip_batch_size, trip_dir)
+
+        # Traffic lights are always agents because they change state
+        for light in range(len(self.city_map.light_x)):
+            pos = (int(self.city_map.light_x[light]), int(self.city_map.light_y[light]))
+            symbol = self.city_map.symbol_at(pos)
+            agent = Traffic_Light(
+                self,
+                self.grid[pos],
+                symbol.islower(),
+                self.city_map.light_duration(light),
+                self.city_map.road_direction(pos)
             )
-            
-            for r, row in enumerate(lines):
-                for c, col in enumerate(row):
-                    y_coord = self.height - r - 1
-                    self.map_grid[(c, y_coord)] = col
-                    
-                    cell = self.grid[(c, y_coord)]
-                    
-                    if col in ["v", "^", ">", "<"]:
-                        agent = Road(self, cell, dataDictionary[col])
-                        
-                    elif col in ["A", "B", "C", "E", "F", "G", "H", "J"]:
-                        direction1 = dataDictionary[col][0]
-                        direction2 = dataDictionary[col][1]
-                        agent = Road(self, cell, direction1, direction2)
-                    
-                    # Traffic lights with road
-                    elif col in ["r", "R", "l", "L", "u", "U", "d", "W"]:
-                        direction = dataDictionary[col][0]
-                        duration = dataDictionary[col][1]
-                        starts_green = col.islower()
-                        agent = Traffic_Light(
-                            self,
-                            cell,
-                            starts_green,
-                            duration,
-                            direction
-                        )
-                        #print(f"semáforo en {cell}")
-                        self.traffic_lights.append(agent)
-                    
-                    elif col == "#":
-                        agent = Obstacle(self, cell)
-                    
-                    elif col == "D":
-                        agent = Destination(self, cell)
+            self.traffic_lights.append(agent)
+
+        # Los semáforos no están en el shuffle de cada step: cambian solo en sus steps programados
+        self.light_scheduler = LightScheduler(self.traffic_lights)
+
+        # Road, Obstacle and Destination agents never step: they are only
+        # created when a frontend asks for them (create_static_agents)
+        self.static_agents_created = False
+        if not lazy_agents:
+            self.create_static_agents()
         
         # Definir las esquinas de spawn
         self.spawn_corners = [
@@ -107,9 +175,52 @@ class CityModel(Model):
 
         # Inicializar grafo 
         self.graph = self.create_directional_graph()
+        self.graph_version = 0 # Se incrementa cada vez que cambia el grafo o sus costos
+        self.pathfinder = AStarPathfinder(self.graph)
+
+        # Tablas de rutas precalculadas hacia cada destino (LRU de routing_tables tablas, por defecto
+        # todas las que caben en routing_memory_mb; con más de routing_max_destinations destinos,
+        # por defecto más de los que caben, no hay tablas y las rutas se buscan con A*)
+        self.destinations = [pos for pos in self.city_map.positions_of(CELL_DESTINATION) if pos in self.graph]
+        self.routing = RoutingTable(self.pathfinder, self.destinations, routing_tables, routing_max_destinations,
+                                    routing_memory_mb)
+        self.build_destination_index()
+
+        # Rutas ya calculadas, compartidas entre carros
+        self.route_cache = RouteCache(route_cache_size)
+
+        # Recalcular rutas de carros bloqueados evitando celdas ocupadas y semáforos en rojo
+        # (opcional: cada recálculo es una búsqueda, más cara que recorrer las tablas)
+        self.congestion_rerouting = congestion_rerouting
+        self.congestion_router = CongestionRouter(self)
+
+        # Contadores de los hot paths; con instrumentation=True también los tiempos por fase del step
+        self.instrumentation = Instrumentation(self)
+        if instrumentation:
+            self.instrumentation.enable()
         
         self.running = True
 
+    def create_static_agents(self):
+        """Create the Road, Obstacle and Destination agents (only once)"""
+        if self.static_agents_created:
+            return
+        self.static_agents_created = True
+
+        for cell_type in (CELL_ROAD, CELL_OBSTACLE, CELL_DESTINATION):
+            for pos in self.city_map.positions_of(cell_type):
+                cell = self.grid[pos]
+                if cell_type == CELL_ROAD:
+                    direction = self.city_map.road_direction(pos)
+                    if isinstance(direction, tuple):
+                        Road(self, cell, direction[0], direction[1])
+                    else:
+                        Road(self, cell, direction)
+                elif cell_type == CELL_OBSTACLE:
+                    Obstacle(self, cell)
+                else:
+                    Destination(self, cell)
+
     def get_directions_from_symbol(self, symbol):
         """Get allowed movement directions from a map symbol"""
         directions_map = {
@@ -169,11 +280,20 @@ class CityModel(Model):
         return valid_directions
 
     def create_directional_graph(self):
-        """Create a directed graph that respects road directions"""
+        """Create a directed graph that respects road directions, from the map layers"""
+        graph = build_csr_graph(self.city_map)
+
+        if self.graph_backend == "dict":
+            graph = graph.to_dict()
+        return graph
+
+    def create_directional_graph_from_symbols(self):
+        """
+        Build the graph cell by cell from map_grid.
+        Kept as reference for create_directional_graph (same nodes, edges and order).
+        """
         graph = {}
         
-        print("Creando grafo direccional")
-        
         # Para cada posición en el mapa, determinar conexiones salientes
         for current_pos, symbol in self.map_grid.items():
             if symbol == "#":  # Saltar obstáculos
@@ -196,6 +316,9 @@ class CityModel(Model):
         
         # Verificar y agregar conexiones para destinos
         self.add_destination_connections(graph)
+
+        if self.graph_backend == "csr":
+            graph = CSRGraph.from_dict(graph, self.width, self.height)
         
         return graph
 
@@ -213,7 +336,10 @@ class CityModel(Model):
                         if self.can_move_to(adj_pos, pos):
                             # Agregar conexión desde la celda adyacente al destino
                             if pos not in [conn[0] for conn in graph[adj_pos]]:
-                                graph[adj_pos].append((pos, 1))
+                                if isinstance(graph, CSRGraph):
+                                    graph.add_edge(adj_pos, pos, 1)
+                                else:
+                                    graph[adj_pos].append((pos, 1))
 
     def can_move_to(self, from_pos, to_pos):
         """Check if the actual cell can reach the nex cell based on road directions"""
@@ -258,6 +384,34 @@ class CityModel(Model):
             
         return cost
 
+    def update_edge_cost(self, from_pos, to_pos, cost):
+        """
+        Change the cost of a graph edge (a cost of None removes it) and
+        propagate the change to the pathfinder and the routing tables.
+        """
+        if isinstance(self.graph, CSRGraph):
+            old_cost = self.graph.set_edge(from_pos, to_pos, cost)
+        else:
+            connections = self.graph.setdefault(from_pos, [])
+            old_cost = None
+            for i, (next_pos, edge_cost) in enumerate(connections):
+                if next_pos == to_pos:
+                    old_cost = edge_cost
+                    if cost is None:
+                        del connections[i]
+                    else:
+                        connections[i] = (to_pos, cost)
+                    break
+            else:
+                if cost is not None:
+                    connections.append((to_pos, cost))
+        if old_cost == cost:
+            return
+
+        self.graph_version += 1
+        self.pathfinder.update_edge_cost(from_pos, to_pos, cost)
+        self.routing.update_edge(from_pos, to_pos, old_cost, cost)
+
     def print_graph_info(self):
         """Print information about the graph"""
         print(f"Tamaño del grafo: {len(self.graph)} nodos")
@@ -288,17 +442,17 @@ class CityModel(Model):
             if corner not in self.graph or not self.graph[corner]:
                 continue
             
-            if any(isinstance(agent, Car) for agent in self.grid[corner].agents):
+            if self.occupancy_index.is_occupied(corner):
                 continue
             
             destination_found = False
             
             for attempt in range(3):
-                destination_pos = self.get_random_destination()
+                destination_pos = self.get_random_destination(corner)
                 if not destination_pos:
                     continue
                 
-                path_to_follow = self.find_path(corner, destination_pos)
+                path_to_follow = self.get_route(corner, destination_pos)
                 
                 if path_to_follow:
                     cell_inicial = self.grid[corner]
@@ -315,8 +469,44 @@ class CityModel(Model):
         x2, y2 = pos2
         return math.sqrt((x1 - x2)**2 + (y1 - y2)**2)
 
+    def get_route(self, start_pos, goal_pos):
+        """
+        Get a route to goal_pos: a walk over the routing tables when the goal
+        is a destination, an A* search otherwise.
+        Routes are cached and returned as shared tuples (do not modify them).
+        """
+        key = (start_pos, goal_pos, self.graph_version)
+        found, route = self.route_cache.get(key)
+        if found:
+            return route
+
+        if self.routing.has_destination(goal_pos):
+            path = self.routing.path(start_pos, goal_pos)
+        else:
+            path = self.find_path(start_pos, goal_pos)
+
+        route = tuple(path) if path else None
+        self.route_cache.put(key, route)
+        return route
+
+    def get_reroute(self, start_pos, goal_pos):
+        """
+        Route for a car that has to recalculate: avoids the current jams and
+        red lights when congestion_rerouting is on, otherwise same as get_route.
+        """
+        if self.congestion_rerouting:
+            return self.congestion_router.path(start_pos, goal_pos)
+        return self.get_route(start_pos, goal_pos)
+
     def find_path(self, start_pos, goal_pos):
-        """Find optimal path using A* with directional graph"""
+        """Find optimal path using the heap-based A* pathfinder"""
+        return self.pathfinder.find_path(start_pos, goal_pos)
+
+    def find_path_list_scan(self, start_pos, goal_pos):
+        """
+        Original A* with a linear scan of the open list.
+        Kept as reference for benchmarks and to validate AStarPathfinder.
+        """
         if start_pos not in self.graph:
             # print(f"ERROR: Start position {start_pos} not in graph")
             return None
@@ -407,22 +597,42 @@ class CityModel(Model):
         path.reverse()
         return path
 
-    def get_random_destination(self):
-        """Get a random destination position that's in the graph"""
-        destinations = []
-        for pos, symbol in self.map_grid.items():
-            if symbol == "D" and pos in self.graph:
-                # Verificar que el destino sea alcanzable (tenga conexiones entrantes)
-                has_incoming = any(pos in [conn[0] for conn in connections] 
-                                 for connections in self.graph.values())
-                if has_incoming:
-                    destinations.append(pos)
-        
+    def build_destination_index(self):
+        """
+        Cache the destinations that have incoming connections and, for each
+        spawn corner, the ones that can actually be reached from it.
+        """
+        # Destinos con conexiones entrantes (usando la adyacencia inversa)
+        self.reachable_destinations = [pos for pos in self.destinations if self.routing.has_predecessors(pos)]
+
+        self.corner_destinations = {}
+        for corner in self.spawn_corners:
+            reached = self.pathfinder.reachable_from(corner)
+            self.corner_destinations[corner] = [
+                pos for pos in self.reachable_destinations if reached[self.pathfinder.node_id(pos)]
+            ]
+        self.destination_index_version = self.graph_version
+
+    def get_random_destination(self, origin=None):
+        """
+        Get a random destination position that's in the graph.
+        If origin is a spawn corner, only destinations reachable from it are chosen.
+        """
+        # El índice solo se invalida cuando cambia el grafo
+        if self.destination_index_version != self.graph_version:
+            self.build_destination_index()
+
+        if origin in self.corner_destinations:
+            destinations = self.corner_destinations[origin]
+        else:
+            destinations = self.reachable_destinations
+
         return self.random.choice(destinations) if destinations else None
             
     def step(self):
         """ Adevance the model by one step"""
-        self.datacollector.collect(self)
+        if self.steps_count % self.collect_every == 0:
+            self.datacollector.collect(self)
         
         self.steps_count += 1
         
@@ -430,30 +640,36 @@ class CityModel(Model):
         if ((self.steps_count - 1) % self.spawn_time == 0) and self.cars_spawned < self.num_agents:
             self.spawn_car()
         
-        # Ejecutar steps de todos los agentes
-        self.agents.shuffle_do("step")
+        # Cambiar solo los semáforos programados para este step
+        self.light_scheduler.advance(self.steps)
+
+        # Ejecutar steps de los carros (los demás agentes no hacen nada en su step)
+        cars = self.agents_by_type.get(Car)
+        if cars:
+            cars.shuffle_do("step")
+
+    def traffic_light_states(self, step=None):
+        """State (True = green) of every traffic light, now or after any given step"""
+        if step is None:
+            return [light.state for light in self.traffic_lights]
+        return self.light_scheduler.states_at(step)
         
     @staticmethod
     def count_active_cars(model):
-        """Count active cars (not at destination)"""
-        cars = model.agents.select(lambda x: isinstance(x, Car) and 
-                                           (not hasattr(x, 'state') or x.state != "In destination"))
-        return len(cars)
+        """Count active cars (not at destination): the cars placed in the grid, from the car tracker"""
+        return len(model.car_tracker.positions)
 
     @staticmethod
     def count_arrived_this_step(model):
-        """Count cars that arrived in current step"""
-        if not hasattr(model, '_arrived_this_step'):
-            model._arrived_this_step = 0
-        
+        """Count cars that arrived since the last collection (the current step when collect_every = 1)"""
         arrived = model._arrived_this_step
-        model._arrived_this_step = 0  # Resetear para el próximo step
+        model._arrived_this_step = 0  # Resetear para la próxima recolección
         return arrived
 
     @staticmethod
     def average_moves(model):
-        """Get average moves from all the cars"""
-        cars = model.agents.select(lambda x: isinstance(x, Car))
-        if cars:
-            return sum(car.moves for car in cars) / len(cars)
+        """Get average moves from all the cars (running sum kept by the cars)"""
+        active = model.count_active_cars(model)
+        if active:
+            return model.active_moves / active
         return 0
\ No newline at end of file
@@ -0,0 +1,182 @@
+from array import array
+import heapq
+import math
+
+from .csr_graph import CSRGraph
+
+class AStarPathfinder:
+    """
+    A* search over the directional graph of a CityModel.
+
+    The graph is indexed once into integer node ids and flat CSR-style lists
+    (offsets, targets, costs), so each search only needs a binary heap (with
+    lazy deletion of stale entries), a dict of g-scores and a shared parent
+    array. Paths are identical to the ones produced by the original list-scan
+    implementation: ties on f are broken by discovery order.
+    """
+
+    def __init__(self, graph, max_iterations=10000):
+        """
+        Creates a new pathfinder.
+        Args:
+            graph: Dict {pos: [(next_pos, cost), ...]} or CSRGraph
+            max_iterations: Maximum number of node expansions per search
+        """
+        self.graph = graph
+        self.max_iterations = max_iterations
+        self.expanded = 0 # Nodos expandidos en todas las búsquedas
+        self.rebuild()
+
+    def rebuild(self):
+        """
+        Index the graph into integer ids. Call it again whenever the graph changes.
+        """
+        if isinstance(self.graph, CSRGraph):
+            # El grafo CSR ya tiene ids enteros: solo se copian sus arreglos
+            self.graph.flush()
+            self.node_id = self.graph.node_id
+            self.xs = self.graph.node_x.tolist()
+            self.ys = self.graph.node_y.tolist()
+            self.offsets = self.graph.offsets.tolist()
+            self.targets = self.graph.targets.tolist()
+            self.costs = self.graph.costs.tolist()
+        else:
+            positions = list(self.graph.keys())
+            index = {pos: i for i, pos in enumerate(positions)}
+            self.node_id = lambda pos: index.get(pos, -1)
+            self.xs = [pos[0] for pos in positions]
+            self.ys = [pos[1] for pos in positions]
+
+            # Listas planas de aristas con ids enteros en lugar de tuplas
+            self.offsets = [0]
+            self.targets = []
+            self.costs = []
+            for pos in positions:
+                for next_pos, cost in self.graph[pos]:
+                    if next_pos in index:
+                        self.targets.append(index[next_pos])
+                        self.costs.append(cost)
+                self.offsets.append(len(self.targets))
+
+        # Arreglo de padres compartido entre búsquedas: solo se leen las
+        # entradas escritas durante la búsqueda actual, así que no se reinicia
+        self.parent = array("l", [-1]) * len(self.xs)
+
+    def update_edge_cost(self, from_pos, to_pos, cost):
+        """
+        Update the cost of an edge that already exists without reindexing.
+        New or removed edges (cost None) reindex the graph.
+        """
+        from_id = self.node_id(from_pos)
+        to_id = self.node_id(to_pos)
+
+        if cost is not None and from_id >= 0 and to_id >= 0:
+            for edge in range(self.offsets[from_id], self.offsets[from_id + 1]):
+                if self.targets[edge] == to_id:
+                    self.costs[edge] = cost
+                    return
+        self.rebuild()
+
+    def reachable_from(self, start_pos):
+        """
+        Breadth-first search from start_pos.
+        Returns a bytearray indexed by node id (1 = reachable).
+        """
+        reached = bytearray(len(self.xs))
+        start = self.node_id(start_pos)
+        if start < 0:
+            return reached
+
+        offsets, targets = self.offsets, self.targets
+        reached[start] = 1
+        frontier = [start]
+        while frontier:
+            next_frontier = []
+            for node in frontier:
+                for neighbor in targets[offsets[node]:offsets[node + 1]]:
+                    if not reached[neighbor]:
+                        reached[neighbor] = 1
+                        next_frontier.append(neighbor)
+            frontier = next_frontier
+        return reached
+
+    def heuristic(self, pos, goal_pos):
+        """Euclidean distance heuristic for grid"""
+        return math.sqrt((pos[0] - goal_pos[0])**2 + (pos[1] - goal_pos[1])**2)
+
+    def find_path(self, start_pos, goal_pos):
+        """
+        Find the optimal path between two positions.
+        Returns a list of coordinates from start_pos to goal_pos, or None.
+        """
+        start = self.node_id(start_pos)
+        goal = self.node_id(goal_pos)
+        if start < 0 or goal < 0:
+            return None
+
+        xs, ys = self.xs, self.ys
+        offsets, targets, costs = self.offsets, self.targets, self.costs
+        goal_x, goal_y = goal_pos
+        parent = self.parent
+        sqrt = math.sqrt
+        push = heapq.heappush
+        pop = heapq.heappop
+
+        # g-scores and discovery order indexed by node id
+        g_score = {start: 0}
+        discovered = {start: 0}
+        closed = set()
+        parent[start] = -1
+
+        open_heap = [(self.heuristic(start_pos, goal_pos), 0, start)]
+        iterations = 0
+
+        while open_heap and iterations < self.max_iterations:
+            f, order, current = pop(open_heap)
+
+            # Lazy deletion: entries left behind by a better g-score are skipped
+            if current in closed:
+                continue
+            iterations += 1
+
+            if current == goal:
+                self.expanded += iterations
+                return self.reconstruct_path(goal)
+
+            closed.add(current)
+            current_g = g_score[current]
+            first, last = offsets[current], offsets[current + 1]
+
+            for neighbor, cost in zip(targets[first:last], costs[first:last]):
+                if neighbor in closed:
+                    continue
+
+                tentative_g = current_g + cost
+                neighbor_order = discovered.get(neighbor)
+
+                if neighbor_order is None:
+                    # New node discovered
+                    neighbor_order = len(discovered)
+                    discovered[neighbor] = neighbor_order
+                elif tentative_g >= g_score[neighbor]:
+                    continue
+
+                g_score[neighbor] = tentative_g
+                parent[neighbor] = current
+                h = sqrt((xs[neighbor] - goal_x)**2 + (ys[neighbor] - goal_y)**2)
+                push(open_heap, (tentative_g + h, neighbor_order, neighbor))
+
+        self.expanded += iterations
+        return None
+
+    def reconstruct_path(self, goal):
+        """Reconstruct the path from goal to start using the parent array"""
+        path = []
+        current = goal
+
+        while current != -1:
+            path.append((self.xs[current], self.ys[current]))
+            current = self.parent[current]
+
+        path.reverse()
+        return path
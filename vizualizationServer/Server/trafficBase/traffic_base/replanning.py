@@ -0,0 +1,162 @@
+import heapq
+import math
+
+import numpy as np
+
+INFINITY = float("inf")
+
+class CongestionRouter:
+    """
+    Congestion-aware rerouting for the cars of a CityModel.
+
+    The cost of entering a cell is its graph cost plus a live penalty for a
+    car in the cell (occupancy layer) and for a red traffic light. Routes
+    are searched with A* using the distances of the routing tables (graph
+    costs only) as heuristic: penalties are never negative, so it is
+    admissible and exact wherever there is no congestion, and the search
+    only expands the nodes around the jams it has to avoid. The routing
+    tables are kept up to date incrementally by RoutingTable.update_edge, so
+    each reroute reuses them instead of searching from scratch.
+    Penalties are only read from the model when a route is requested, at
+    most once per step (lazy sync). A search that expands more than
+    max_expansions nodes gives up and returns the plain route of the model
+    (routing tables or A*), so a reroute never costs more than a bounded
+    search plus a table walk.
+    """
+
+    def __init__(self, model, congestion_cost=4, red_light_cost=3, max_expansions=128):
+        """
+        Creates the router.
+        Args:
+            model: CityModel (uses its pathfinder index, routing tables, occupancy and lights)
+            congestion_cost: Extra cost of entering a cell with a car
+            red_light_cost: Extra cost of entering a red traffic light
+            max_expansions: Nodes expanded before falling back to model.get_route
+        """
+        self.model = model
+        self.congestion_cost = congestion_cost
+        self.red_light_cost = red_light_cost
+        self.max_expansions = max_expansions
+        self.expanded = 0
+        self.fallbacks = 0 # Búsquedas que llegaron a max_expansions
+        self.rebuild()
+
+    def rebuild(self):
+        """Index the graph (shared with the pathfinder). Called when the graph version changes."""
+        model = self.model
+        pathfinder = model.pathfinder
+        self.graph_version = model.graph_version
+        self.num_nodes = len(pathfinder.xs)
+
+        # Celda plana y semáforo de cada nodo
+        xs = np.asarray(pathfinder.xs, dtype=np.int64)
+        ys = np.asarray(pathfinder.ys, dtype=np.int64)
+        self.node_cell = xs * model.height + ys
+        self.node_light = np.asarray(model.city_map.flat_light_id, dtype=np.int64)[self.node_cell]
+        self.penalty = np.zeros(self.num_nodes, dtype=np.int64)
+        self.penalty_list = self.penalty.tolist()
+        self.synced_step = None
+
+    def update_penalties(self):
+        """Read the occupancy layer and the light states (once per step)"""
+        model = self.model
+        if model.graph_version != self.graph_version or len(model.pathfinder.xs) != self.num_nodes:
+            self.rebuild()
+        if self.synced_step == model.steps:
+            return
+        self.synced_step = model.steps
+
+        occupancy = model.occupancy_index.as_array()[self.node_cell]
+        penalty = occupancy.astype(np.int64) * self.congestion_cost
+        if len(model.traffic_lights):
+            green = np.array([light.state for light in model.traffic_lights], dtype=bool)
+            has_light = self.node_light >= 0
+            red = np.zeros(self.num_nodes, dtype=bool)
+            red[has_light] = ~green[self.node_light[has_light]]
+            penalty += red * self.red_light_cost
+        self.penalty = penalty
+        self.penalty_list = penalty.tolist()
+
+    def congestion_costs(self):
+        """Current penalty of every cell as a (width, height) array"""
+        self.update_penalties()
+        costs = np.zeros(self.model.width * self.model.height, dtype=np.int64)
+        costs[self.node_cell] = self.penalty
+        return costs.reshape(self.model.width, self.model.height)
+
+    def heuristic(self, goal_pos):
+        """
+        Distance to goal_pos of every node id: the distance array of its routing table.
+        None if goal_pos has no routing table.
+        """
+        return self.model.routing.distances(goal_pos)
+
+    def path(self, start_pos, goal_pos):
+        """
+        Cheapest route from start_pos to goal_pos under the current congestion.
+        Returns a list of coordinates, or None.
+        """
+        self.update_penalties()
+        pathfinder = self.model.pathfinder
+        start = pathfinder.node_id(start_pos)
+        goal = pathfinder.node_id(goal_pos)
+        if start < 0 or goal < 0:
+            return None
+
+        xs, ys = pathfinder.xs, pathfinder.ys
+        table = self.heuristic(goal_pos)
+        if table is not None:
+            h = table.__getitem__
+        else:
+            # Sin tabla: distancia euclidiana (cada arista cuesta al menos 1)
+            goal_x, goal_y = goal_pos
+            h = lambda node: math.sqrt((xs[node] - goal_x)**2 + (ys[node] - goal_y)**2)
+        if h(start) == INFINITY:
+            return None
+
+        offsets, targets, costs = pathfinder.offsets, pathfinder.targets, pathfinder.costs
+        penalty = self.penalty_list
+        parent = pathfinder.parent
+        push, pop = heapq.heappush, heapq.heappop
+
+        g_score = {start: 0}
+        closed = set()
+        parent[start] = -1
+        open_heap = [(h(start), 0, start)]
+        order = 0
+        expanded = 0
+        max_expansions = self.max_expansions
+
+        while open_heap:
+            f, _, current = pop(open_heap)
+            if current in closed:
+                continue
+            if current == goal:
+                self.expanded += expanded
+                return pathfinder.reconstruct_path(goal)
+            if expanded >= max_expansions:
+                # Búsqueda demasiado larga: ruta sin congestión
+                self.expanded += expanded
+                self.fallbacks += 1
+                route = self.model.get_route(start_pos, goal_pos)
+                return list(route) if route else None
+            closed.add(current)
+            expanded += 1
+
+            current_g = g_score[current]
+            for edge in range(offsets[current], offsets[current + 1]):
+                neighbor = targets[edge]
+                if neighbor in closed:
+                    continue
+                estimate = h(neighbor)
+                if estimate == INFINITY:
+                    continue
+                tentative_g = current_g + costs[edge] + penalty[neighbor]
+                if tentative_g < g_score.get(neighbor, INFINITY):
+                    g_score[neighbor] = tentative_g
+                    parent[neighbor] = current
+                    order += 1
+                    push(open_heap, (tentative_g + estimate, order, neighbor))
+
+        self.expanded += expanded
+        return None
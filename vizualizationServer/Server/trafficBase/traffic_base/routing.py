@@ -0,0 +1,212 @@
+from array import array
+from collections import OrderedDict
+import heapq
+
+INFINITY = float("inf")
+
+class RoutingTable:
+    """
+    Precomputed shortest-path tables toward the destinations.
+
+    For each destination a reverse Dijkstra over the directional graph stores
+    the distance to that destination and the next hop from every node that can
+    reach it, so a route is obtained by walking next hops instead of searching.
+    Tables are flat arrays indexed by the node ids of the pathfinder (float32
+    distances, int32 next hops, -1 = no route), built the first time a
+    destination is requested and kept in an LRU. By default the LRU holds
+    every destination if the tables fit in memory_mb, otherwise as many as fit.
+    Maps with more than max_destinations destinations (by default: more tables
+    than fit in memory_mb) get no tables at all: has_destination is False and
+    the model falls back to A*.
+    """
+
+    def __init__(self, pathfinder, destinations, max_tables=None, max_destinations=None, memory_mb=512):
+        """
+        Creates the routing tables.
+        Args:
+            pathfinder: AStarPathfinder of the graph (node ids and CSR lists).
+                It must be updated before update_edge is called.
+            destinations: Positions that get a table
+            max_tables: Maximum number of tables kept in memory (LRU), default from memory_mb
+            max_destinations: Above this number of destinations no table is built,
+                default the number of tables that fit in memory_mb
+            memory_mb: Memory budget of the tables when max_tables is not given
+        """
+        self.pathfinder = pathfinder
+        self.destinations = list(destinations)
+        # Cada tabla: 4 bytes de distancia y 4 de siguiente salto por nodo
+        tables_in_budget = max(memory_mb * 2**20 // (max(len(pathfinder.xs), 1) * 8), 1)
+        if max_tables is None:
+            max_tables = min(len(self.destinations), tables_in_budget)
+        self.max_tables = max(max_tables, 1)
+        # Si las tablas de todos los destinos no caben, el LRU se reconstruiría sin parar: mejor A*
+        if max_destinations is None:
+            max_destinations = tables_in_budget
+        self.enabled = len(self.destinations) <= max_destinations
+        if not self.enabled:
+            print(f"Tablas de rutas desactivadas: {len(self.destinations)} destinos > {max_destinations} "
+                  f"(memoria para tablas: {memory_mb} MB); las rutas se buscan con A*")
+        self.destination_set = set(self.destinations) if self.enabled else set()
+        self.tables = OrderedDict() # destino -> (distance, next_hop)
+        self.tables_built = 0 # Tablas construidas (incluye las reconstruidas)
+        self.evictions = 0
+        self.build_reverse_index()
+
+    def build_reverse_index(self):
+        """Reverse adjacency of the pathfinder graph as flat lists of node ids"""
+        pathfinder = self.pathfinder
+        num_nodes = len(pathfinder.xs)
+        offsets, targets, costs = pathfinder.offsets, pathfinder.targets, pathfinder.costs
+
+        # Contar las aristas entrantes de cada nodo y acomodarlas por destino
+        reverse_offsets = [0] * (num_nodes + 1)
+        for target in targets:
+            reverse_offsets[target + 1] += 1
+        for node in range(num_nodes):
+            reverse_offsets[node + 1] += reverse_offsets[node]
+
+        fill = reverse_offsets[:-1]
+        sources = [0] * len(targets)
+        reverse_costs = [0] * len(targets)
+        for node in range(num_nodes):
+            for edge in range(offsets[node], offsets[node + 1]):
+                slot = fill[targets[edge]]
+                sources[slot] = node
+                reverse_costs[slot] = costs[edge]
+                fill[targets[edge]] = slot + 1
+
+        self.num_nodes = num_nodes
+        self.reverse_offsets = reverse_offsets
+        self.reverse_sources = sources
+        self.reverse_costs = reverse_costs
+        self.reverse_dirty = False
+
+    def rebuild(self):
+        """Drop every table; they are built again on demand"""
+        self.tables.clear()
+        self.build_reverse_index()
+
+    def build_all(self):
+        """Build the table of every destination (up to max_tables are kept)"""
+        for destination in self.destinations[:self.max_tables] if self.enabled else []:
+            if destination not in self.tables:
+                self.build_table(destination)
+
+    def build_table(self, destination):
+        """Reverse Dijkstra from one destination"""
+        if self.reverse_dirty:
+            self.build_reverse_index()
+        goal = self.pathfinder.node_id(destination)
+        distance = array("f", [INFINITY]) * self.num_nodes
+        next_hop = array("i", [-1]) * self.num_nodes
+
+        if goal >= 0:
+            offsets, sources, costs = self.reverse_offsets, self.reverse_sources, self.reverse_costs
+            push, pop = heapq.heappush, heapq.heappop
+            distance[goal] = 0
+            open_heap = [(0, goal)]
+
+            while open_heap:
+                dist, node = pop(open_heap)
+                if dist > distance[node]:
+                    continue
+                for edge in range(offsets[node], offsets[node + 1]):
+                    previous = sources[edge]
+                    new_dist = dist + costs[edge]
+                    if new_dist < distance[previous]:
+                        # El siguiente salto de previous es el nodo desde el que se relajó
+                        distance[previous] = new_dist
+                        next_hop[previous] = node
+                        push(open_heap, (new_dist, previous))
+
+        self.tables[destination] = (distance, next_hop)
+        self.tables.move_to_end(destination)
+        self.tables_built += 1
+        while len(self.tables) > self.max_tables:
+            self.tables.popitem(last=False)
+            self.evictions += 1
+        return distance, next_hop
+
+    def table(self, destination):
+        """(distance, next_hop) arrays of a destination, or None if it has no table"""
+        if destination not in self.destination_set:
+            return None
+        table = self.tables.get(destination)
+        if table is None:
+            return self.build_table(destination)
+        self.tables.move_to_end(destination)
+        return table
+
+    def distances(self, destination):
+        """Distance to destination of every node id, or None if it has no table"""
+        table = self.table(destination)
+        return table[0] if table is not None else None
+
+    def has_destination(self, destination):
+        """Check if the destination has (or can have) a table"""
+        return destination in self.destination_set
+
+    def has_predecessors(self, pos):
+        """Check if some edge of the graph enters pos"""
+        if self.reverse_dirty:
+            self.build_reverse_index()
+        node = self.pathfinder.node_id(pos)
+        return node >= 0 and self.reverse_offsets[node + 1] > self.reverse_offsets[node]
+
+    def path(self, start_pos, destination):
+        """
+        Walk the table from start_pos to destination.
+        Returns a list of coordinates, or None if the destination is unreachable.
+        """
+        table = self.table(destination)
+        if table is None:
+            return None
+        if start_pos == destination:
+            return [start_pos]
+
+        next_hop = table[1]
+        pathfinder = self.pathfinder
+        node = pathfinder.node_id(start_pos)
+        if node < 0 or next_hop[node] < 0:
+            return None
+
+        xs, ys = pathfinder.xs, pathfinder.ys
+        path = [start_pos]
+        node = next_hop[node]
+        while node >= 0:
+            path.append((xs[node], ys[node]))
+            node = next_hop[node]
+        return path
+
+    def update_edge(self, from_pos, to_pos, old_cost, new_cost):
+        """
+        Update the tables after the cost of an edge changed.
+        Use None as old_cost for a new edge and as new_cost for a removed edge.
+        Only the destinations whose shortest paths can change are rebuilt.
+        """
+        old_cost = INFINITY if old_cost is None else old_cost
+        new_cost = INFINITY if new_cost is None else new_cost
+
+        # La adyacencia inversa se vuelve a leer del pathfinder en el siguiente build
+        self.reverse_dirty = True
+        pathfinder = self.pathfinder
+        from_id = pathfinder.node_id(from_pos)
+        to_id = pathfinder.node_id(to_pos)
+        if len(pathfinder.xs) != self.num_nodes or from_id < 0 or to_id < 0:
+            # Cambiaron los ids de los nodos: ninguna tabla sirve
+            self.rebuild()
+            return
+
+        # Solo las tablas ya construidas necesitan actualizarse
+        for destination, (distance, next_hop) in list(self.tables.items()):
+            to_distance = distance[to_id]
+            if to_distance == INFINITY:
+                continue
+
+            # Cheaper than the current best route from from_pos
+            improves = new_cost + to_distance < distance[from_id]
+            # The edge is part of the current shortest-path tree
+            in_tree = next_hop[from_id] == to_id
+
+            if improves or (in_tree and new_cost != old_cost):
+                self.build_table(destination)
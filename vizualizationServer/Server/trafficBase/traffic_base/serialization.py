@@ -0,0 +1,161 @@
+import struct
+
+import numpy as np
+
+from .agent import Destination, Obstacle, Road
+
+# Payloads sent to the frontends, built from the model state.
+# Positions use the WebGL layout: x = column, y = 1 (height), z = row of the mesa grid.
+
+# Binary frames (little endian):
+#   header: magic b"TRF1", step u32, cars u32, lights u32, skipped frames u32 (20 bytes)
+#   car ids u32[cars], x u16[cars], z u16[cars], heading u8[cars] (see tracking.HEADING_CODES)
+#   light states: bitset of ceil(lights / 8) bytes, bit i = model.traffic_lights[i] is green
+FRAME_MAGIC = b"TRF1"
+FRAME_HEADER = struct.Struct("<4sIIII")
+
+def car_entry(car_id, pos):
+    """Dictionary of one car as /getCars sends it"""
+    return {"id": str(car_id), "x": pos[0], "y": 1, "z": pos[1]}
+
+def cars_snapshot(tracker):
+    """Every car of the tracker (full snapshot)"""
+    return {
+        "version": tracker.version,
+        "full": True,
+        "positions": [car_entry(car_id, pos) for car_id, pos in tracker.positions.items()],
+    }
+
+def cars_delta(tracker, since):
+    """
+    Cars added, moved or removed after step since.
+    Falls back to a full snapshot if the tracker journal does not cover since.
+    """
+    changes = tracker.changes_since(since)
+    if changes is None:
+        return cars_snapshot(tracker)
+
+    added, moved, removed = changes
+    return {
+        "version": tracker.version,
+        "since": since,
+        "full": False,
+        "added": [car_entry(car_id, pos) for car_id, pos in added.items()],
+        "moved": [car_entry(car_id, pos) for car_id, pos in moved.items()],
+        "removed": [str(car_id) for car_id in removed],
+    }
+
+STATIC_LAYERS = {"Road": Road, "Obstacle": Obstacle, "Destination": Destination}
+
+def static_positions(model, agent_type):
+    """Positions of the agents of a static layer (Road, Obstacle or Destination, or its name)"""
+    agent_type = STATIC_LAYERS.get(agent_type, agent_type)
+    agents = model.agents_by_type.get(agent_type, [])
+    return [
+        {"id": str(agent.unique_id), "x": agent.cell.coordinate[0], "y": 1, "z": agent.cell.coordinate[1]}
+        for agent in agents
+    ]
+
+def encode_frame(model, skipped=0):
+    """Columnar binary frame with the cars of the tracker and the light states"""
+    tracker = model.car_tracker
+    count = len(tracker.positions)
+    ids = np.fromiter(tracker.positions.keys(), dtype=np.uint32, count=count)
+    coordinates = np.fromiter(
+        (value for pos in tracker.positions.values() for value in pos), dtype=np.uint16, count=2 * count
+    )
+    headings = np.fromiter(tracker.headings.values(), dtype=np.uint8, count=count)
+    lights = np.packbits(
+        np.fromiter((light.state for light in model.traffic_lights), dtype=bool, count=len(model.traffic_lights)),
+        bitorder="little",
+    )
+
+    header = FRAME_HEADER.pack(FRAME_MAGIC, model.steps, count, len(model.traffic_lights), skipped)
+    return b"".join((
+        header, ids.tobytes(), coordinates[0::2].tobytes(), coordinates[1::2].tobytes(),
+        headings.tobytes(), lights.tobytes(),
+    ))
+
+def columnar_frame(model):
+    """Cars and light states of the current step as parallel lists (compact JSON / MessagePack)"""
+    tracker = model.car_tracker
+    return {
+        "step": model.steps,
+        "ids": [str(car_id) for car_id in tracker.positions],
+        "x": [pos[0] for pos in tracker.positions.values()],
+        "z": [pos[1] for pos in tracker.positions.values()],
+        "heading": list(tracker.headings.values()),
+        "lights": [1 if light.state else 0 for light in model.traffic_lights],
+    }
+
+def traffic_lights_positions(model, step=None):
+    """Traffic lights as /getTrafficLights sends them; with step, their state after that step"""
+    states = model.traffic_light_states(step)
+    return [
+        {
+            "id": str(light.unique_id),
+            "x": light.cell.coordinate[0],
+            "y": 1,
+            "z": light.cell.coordinate[1],
+            "state": "green" if state else "red",
+            "direction": light.direction,
+        }
+        for light, state in zip(model.traffic_lights, states)
+    ]
+
+# Operaciones que los endpoints piden a un modelo, por nombre. Reciben el modelo y regresan
+# datos serializables, así que también se pueden ejecutar en un proceso worker (workers.py).
+
+def cars_operation(model, since=None):
+    if since is None:
+        return cars_snapshot(model.car_tracker)
+    return cars_delta(model.car_tracker, since)
+
+def step_operation(model):
+    model.step()
+    return model.steps
+
+def advance_operation(model, k=1, all_steps=False):
+    """Advance k steps; returns the columnar frames (every step or only the last one)"""
+    frames = []
+    for i in range(k):
+        model.step()
+        if all_steps or i == k - 1:
+            frames.append(columnar_frame(model))
+    return frames
+
+def stream_operation(model, steps, skipped, encode):
+    """Advance for /stream; returns (model still running, binary frame or None)"""
+    if not model.running:
+        return False, None
+    for _ in range(steps):
+        model.step()
+    return True, encode_frame(model, skipped) if encode else None
+
+def metrics_operation(model, last=100):
+    """The last samples of the model metrics (MetricsSink.tail) as lists"""
+    return {name: values.tolist() for name, values in model.datacollector.tail(last).items()}
+
+def instrumentation_operation(model):
+    """Counters, gauges and phase timers of the model (Instrumentation.snapshot)"""
+    return model.instrumentation.snapshot()
+
+def light_ids_operation(model):
+    return [str(light.unique_id) for light in model.traffic_lights]
+
+def static_operation(model, layer):
+    # The static agents are only created the first time a frontend asks for them
+    model.create_static_agents()
+    return static_positions(model, layer)
+
+MODEL_OPERATIONS = {
+    "cars": cars_operation,
+    "step": step_operation,
+    "advance": advance_operation,
+    "stream": stream_operation,
+    "light_ids": light_ids_operation,
+    "metrics": metrics_operation,
+    "instrumentation": instrumentation_operation,
+    "static": static_operation,
+    "traffic_lights": traffic_lights_positions,
+}
@@ -0,0 +1,136 @@
+from collections import OrderedDict
+import threading
+import time
+import uuid
+
+from .serialization import MODEL_OPERATIONS
+
+DEFAULT_SESSION = "default"
+
+class Session:
+    """
+    One simulation hosted by the server: the model plus the state the
+    endpoints keep for it (step counter, serialized static layers).
+    Every access to the model must hold the session lock (run does it).
+    The model is a CityModel or a workers.RemoteModel hosted in a worker process.
+    """
+
+    def __init__(self, session_id, model):
+        self.session_id = session_id
+        self.model = model
+        self.current_step = 0
+        self.static_layers = {}
+        self.lock = threading.RLock()
+        self.last_access = time.monotonic()
+
+    def touch(self):
+        self.last_access = time.monotonic()
+
+    def run(self, name, *args):
+        """Run a model operation (serialization.MODEL_OPERATIONS) with the session lock"""
+        with self.lock:
+            if hasattr(self.model, "run_operation"):
+                return self.model.run_operation(name, *args)
+            return MODEL_OPERATIONS[name](self.model, *args)
+
+    def close(self):
+        """Release the model (only remote models hold resources)"""
+        if hasattr(self.model, "close"):
+            self.model.close()
+
+class SessionRegistry:
+    """
+    Sessions keyed by id, with idle-timeout eviction and a cap on the number
+    of resident models (the least recently used session is evicted first).
+    Each session has its own lock, so different models can step in parallel.
+    """
+
+    def __init__(self, max_sessions=16, idle_timeout=1800):
+        """
+        Creates the registry.
+        Args:
+            max_sessions: Maximum number of models kept in memory
+            idle_timeout: Seconds without requests before a session is evicted (None = never)
+        """
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.sessions = OrderedDict()
+        self.lock = threading.Lock()
+
+    def create(self, model_factory, session_id=None):
+        """
+        Build a model with model_factory(session_id) and register it.
+        An existing session with the same id is replaced. Returns the Session.
+        """
+        session_id = session_id or uuid.uuid4().hex
+        # El modelo se construye fuera del lock del registro (puede tardar)
+        session = Session(session_id, model_factory(session_id))
+
+        evicted = []
+        with self.lock:
+            replaced = self.sessions.pop(session_id, None)
+            if replaced is not None:
+                evicted.append(replaced)
+            self.sessions[session_id] = session
+            evicted.extend(self.evict_idle_locked())
+            while len(self.sessions) > self.max_sessions:
+                evicted.append(self.sessions.popitem(last=False)[1])
+        self.close_sessions(evicted)
+        return session
+
+    def get(self, session_id):
+        """Session with that id (marked as recently used), or None"""
+        with self.lock:
+            evicted = self.evict_idle_locked()
+            session = self.sessions.get(session_id)
+            if session is not None:
+                self.sessions.move_to_end(session_id)
+                session.touch()
+        self.close_sessions(evicted)
+        return session
+
+    def remove(self, session_id):
+        with self.lock:
+            session = self.sessions.pop(session_id, None)
+        self.close_sessions([session] if session is not None else [])
+        return session is not None
+
+    def evict_idle(self):
+        """Drop the sessions idle for longer than idle_timeout"""
+        with self.lock:
+            evicted = self.evict_idle_locked()
+        self.close_sessions(evicted)
+
+    def evict_idle_locked(self):
+        """Remove the idle sessions (registry lock held) and return them"""
+        evicted = []
+        if self.idle_timeout is None:
+            return evicted
+        limit = time.monotonic() - self.idle_timeout
+        # El orden LRU permite detenerse en la primera sesión activa
+        while self.sessions:
+            session_id, session = next(iter(self.sessions.items()))
+            if session.last_access >= limit:
+                break
+            del self.sessions[session_id]
+            evicted.append(session)
+        return evicted
+
+    def close_sessions(self, evicted):
+        """Release the models of removed sessions (outside the registry lock)"""
+        for session in evicted:
+            try:
+                session.close()
+            except Exception as e:
+                print(e)
+
+    def list(self):
+        """The registered sessions, least recently used first"""
+        with self.lock:
+            return list(self.sessions.values())
+
+    def __len__(self):
+        return len(self.sessions)
+
+    def __contains__(self, session_id):
+        return session_id in self.sessions
@@ -0,0 +1,129 @@
+# Parameter sweep of CityModel without frontends: every combination of N, spawn_time and seed
+# runs for a fixed number of steps in a process pool. Each run is saved in its own .npz chunk
+# (named after its parameters, steps and map), so an interrupted sweep resumes with the runs that
+# are missing and a sweep with other steps or map never reuses them, and at the end the chunks are
+# combined in one columnar .npz (one array per column, one row per run and step).
+#
+#   python -m traffic_base.sweep --agents 100 500 --spawn-times 1 5 --seeds 1 2 3 --steps 500 --out sweeps/base
+
+import argparse
+import hashlib
+import itertools
+import multiprocessing
+import os
+
+import numpy as np
+
+from .map_loader import resolve_path
+from .model import CityModel
+
+METRICS = ["Active_cars", "Arrived_per_step", "Total_arrived", "Total_spawned", "Average_moves"]
+PARAMETERS = ["N", "spawn_time", "seed"]
+
+def sweep_configurations(agents, spawn_times, seeds):
+    """Every combination of the parameter values, as dictionaries of CityModel arguments"""
+    return [
+        {"N": n, "spawn_time": spawn_time, "seed": seed}
+        for n, spawn_time, seed in itertools.product(agents, spawn_times, seeds)
+    ]
+
+def map_key(map_file):
+    """Map name plus a hash of its contents (same name with other contents gives another key)"""
+    with open(map_file, "rb") as f:
+        digest = hashlib.sha1(f.read()).hexdigest()[:8]
+    return f"{os.path.splitext(os.path.basename(map_file))[0]}-{digest}"
+
+def run_name(config, steps, map_name):
+    return f"run_N{config['N']}_s{config['spawn_time']}_seed{config['seed']}_steps{steps}_{map_name}"
+
+def run_configuration(job):
+    """
+    Run one configuration and save its chunk (executed in the pool).
+    job: (config, steps, map_file, path). Returns the path of the chunk.
+    """
+    config, steps, map_file, path = job
+    # Toda la serie cabe en el buffer de métricas (steps muestras más la final)
+    model = CityModel(map_file=map_file, metrics_capacity=steps + 1, **config)
+    for _ in range(steps):
+        model.step()
+    # Estado después del último step
+    model.datacollector.collect(model)
+
+    data = model.datacollector.get_model_vars_dataframe()
+    columns = {metric: data[metric].to_numpy(dtype=np.float64) for metric in METRICS}
+    columns["step"] = np.arange(len(data), dtype=np.int64)
+    for parameter in PARAMETERS:
+        columns[parameter] = np.full(len(data), config[parameter], dtype=np.int64)
+
+    # Escribir a un archivo temporal y renombrar: un chunk existe completo o no existe
+    temporary = path + ".tmp.npz"
+    np.savez(temporary, **columns)
+    os.replace(temporary, path)
+    return path
+
+def run_sweep(configs, steps, output_dir, map_file="city_files/new_map.txt", processes=None, resume=True):
+    """
+    Run every configuration missing in output_dir and return the paths of all the chunks.
+    Args:
+        configs: CityModel arguments of each run (see sweep_configurations)
+        steps: Steps of every run
+        output_dir: Directory of the per-run chunks
+        map_file: Map of every run
+        processes: Size of the process pool (default: number of CPUs)
+        resume: Skip the runs whose chunk already exists
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    # Los workers pueden tener otro directorio de trabajo: ruta absoluta del mapa
+    # (relativa al directorio actual si existe ahí, si no a los mapas del paquete, como CityModel)
+    map_file = os.path.abspath(resolve_path(map_file))
+    map_name = map_key(map_file)
+
+    paths = [os.path.join(output_dir, run_name(config, steps, map_name) + ".npz") for config in configs]
+    jobs = [
+        (config, steps, map_file, path)
+        for config, path in zip(configs, paths)
+        if not (resume and os.path.exists(path))
+    ]
+    print(f"{len(configs) - len(jobs)} runs already done, {len(jobs)} to run")
+
+    if jobs:
+        with multiprocessing.Pool(processes) as pool:
+            for done, path in enumerate(pool.imap_unordered(run_configuration, jobs), 1):
+                print(f"[{done}/{len(jobs)}] {os.path.basename(path)}")
+    return paths
+
+def combine_runs(paths, output_file):
+    """Concatenate the chunks in one columnar .npz (columns: parameters, step and metrics)"""
+    chunks = []
+    for path in paths:
+        with np.load(path) as chunk:
+            chunks.append({name: chunk[name] for name in chunk.files})
+
+    columns = {
+        name: np.concatenate([chunk[name] for chunk in chunks])
+        for name in PARAMETERS + ["step"] + METRICS
+    }
+    np.savez_compressed(output_file, **columns)
+    return columns
+
+def main():
+    parser = argparse.ArgumentParser(description="Parameter sweep of CityModel over N, spawn_time and seed")
+    parser.add_argument("--agents", type=int, nargs="+", default=[100, 300])
+    parser.add_argument("--spawn-times", type=int, nargs="+", default=[1, 5, 10])
+    parser.add_argument("--seeds", type=int, nargs="+", default=[1, 2, 3])
+    parser.add_argument("--steps", type=int, default=500)
+    parser.add_argument("--map", default="city_files/new_map.txt")
+    parser.add_argument("--processes", type=int, default=None, help="Size of the process pool (default: CPUs)")
+    parser.add_argument("--out", default="sweeps/sweep", help="Directory of the per-run chunks")
+    parser.add_argument("--no-resume", action="store_true", help="Run again the runs already saved")
+    args = parser.parse_args()
+
+    configs = sweep_configurations(args.agents, args.spawn_times, args.seeds)
+    paths = run_sweep(configs, args.steps, args.out, args.map, args.processes, resume=not args.no_resume)
+
+    output_file = os.path.join(args.out, "combined.npz")
+    columns = combine_runs(paths, output_file)
+    print(f"{len(configs)} runs, {len(columns['step'])} rows -> {output_file}")
+
+if __name__ == "__main__":
+    main()
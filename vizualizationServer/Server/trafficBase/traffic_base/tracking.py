@@ -0,0 +1,146 @@
+from collections import deque
+
+import numpy as np
+
+from .map_loader import DIRECTION_OFFSETS, DIRECTIONS
+
+# Código de dirección de cada desplazamiento (índice en DIRECTIONS); UNKNOWN_HEADING al aparecer
+HEADING_CODES = {DIRECTION_OFFSETS[direction]: code for code, direction in enumerate(DIRECTIONS)}
+UNKNOWN_HEADING = 255
+
+class OccupancyIndex:
+    """
+    Spatial index of the cars: a dense layer with the number of cars in each
+    cell (indexed as the flat map layers, x * height + y) and the position of
+    every car by id. Both are updated together on each spawn, move and
+    removal, so blocking checks are O(1) and listing the cars is O(cars),
+    without scanning the agents of the grid cells.
+    """
+
+    def __init__(self, width, height):
+        """
+        Creates an empty index.
+        Args:
+            width: Width of the grid
+            height: Height of the grid
+        """
+        self.width = width
+        self.height = height
+        self.cells = bytearray(width * height)  # Carros por celda
+        self.positions = {}  # unique_id -> (x, y)
+
+    def index(self, pos):
+        """Flat index of a position"""
+        return pos[0] * self.height + pos[1]
+
+    def is_occupied(self, pos):
+        return self.cells[pos[0] * self.height + pos[1]] > 0
+
+    def place(self, car_id, pos):
+        """Put a car at pos (None removes it). Returns its previous position."""
+        old_pos = self.positions.get(car_id)
+        if old_pos == pos:
+            return old_pos
+        if old_pos is not None:
+            self.cells[old_pos[0] * self.height + old_pos[1]] -= 1
+        if pos is None:
+            del self.positions[car_id]
+        else:
+            self.cells[pos[0] * self.height + pos[1]] += 1
+            self.positions[car_id] = pos
+        return old_pos
+
+    def as_array(self):
+        """The occupancy layer as a NumPy uint8 view (no copy)"""
+        return np.frombuffer(self.cells, dtype=np.uint8)
+
+    def __len__(self):
+        return len(self.positions)
+
+class CarTracker:
+    """
+    Positions of the cars of a model, updated as they move, plus a journal
+    of the changes stamped with the model step in which they happened.
+    The positions live in the OccupancyIndex of the tracker.
+
+    The journal keeps the changes of the last max_steps steps, so a client
+    that knows the positions at step v can ask only for what changed after
+    v (changes_since). Older clients need a full snapshot.
+    """
+
+    def __init__(self, model, occupancy, max_steps=100):
+        """
+        Creates the tracker.
+        Args:
+            model: Model whose steps stamp the changes
+            occupancy: OccupancyIndex updated by move
+            max_steps: Steps of changes kept in the journal
+        """
+        self.model = model
+        self.occupancy = occupancy
+        self.max_steps = max_steps
+        self.headings = {}       # unique_id -> código de dirección del último movimiento
+        self.journal = deque()   # (step, unique_id, old_pos, new_pos)
+        self.oldest_version = 0  # changes_since acepta since >= oldest_version
+
+    @property
+    def positions(self):
+        """unique_id -> (x, y) of the active cars"""
+        return self.occupancy.positions
+
+    @property
+    def version(self):
+        """Version of the current positions (the last model step)"""
+        return self.model.steps
+
+    def move(self, car_id, pos):
+        """Record that a car is now at pos (None when it is removed)"""
+        old_pos = self.occupancy.place(car_id, pos)
+        if old_pos == pos:
+            return
+        if pos is None:
+            self.headings.pop(car_id, None)
+        else:
+            if old_pos is None:
+                self.headings[car_id] = UNKNOWN_HEADING
+            else:
+                offset = (pos[0] - old_pos[0], pos[1] - old_pos[1])
+                self.headings[car_id] = HEADING_CODES.get(offset, self.headings.get(car_id, UNKNOWN_HEADING))
+
+        step = self.model.steps
+        self.journal.append((step, car_id, old_pos, pos))
+
+        # Descartar los cambios más viejos que max_steps
+        limit = step - self.max_steps
+        if limit > self.oldest_version:
+            while self.journal and self.journal[0][0] <= limit:
+                self.journal.popleft()
+            self.oldest_version = limit
+
+    def changes_since(self, since):
+        """
+        Cars added, moved and removed after step since.
+        Returns (added, moved, removed) as ({id: pos}, {id: pos}, [id]),
+        or None if the journal no longer covers that step.
+        """
+        if since < self.oldest_version or since > self.version:
+            return None
+
+        # Primer posición anterior y última posición nueva de cada carro
+        first_old, last_new = {}, {}
+        for step, car_id, old_pos, new_pos in reversed(self.journal):
+            if step <= since:
+                break
+            first_old[car_id] = old_pos
+            last_new.setdefault(car_id, new_pos)
+
+        added, moved, removed = {}, {}, []
+        for car_id, new_pos in last_new.items():
+            old_pos = first_old[car_id]
+            if old_pos is None and new_pos is not None:
+                added[car_id] = new_pos
+            elif new_pos is None and old_pos is not None:
+                removed.append(car_id)
+            elif old_pos != new_pos and new_pos is not None:
+                moved[car_id] = new_pos
+        return added, moved, removed
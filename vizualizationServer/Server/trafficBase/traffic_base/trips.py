@@ -0,0 +1,123 @@
+import os
+
+import numpy as np
+
+# Columnas de cada viaje terminado (struct of arrays)
+TRIP_COLUMNS = {
+    "car_id": np.int64,
+    "origin_x": np.int32,
+    "origin_y": np.int32,
+    "destination_x": np.int32,
+    "destination_y": np.int32,
+    "spawn_step": np.int32,
+    "end_step": np.int32,
+    "arrived": np.bool_,
+    "red_light_waits": np.int32,
+    "car_blocks": np.int32,
+    "reroutes": np.int32,
+    "moves": np.int32,
+}
+
+class TripLog:
+    """
+    Record of every finished car trip: spawn and end step, steps waiting at red
+    traffic lights, steps blocked by other cars and route recalculations.
+
+    While a car drives, its counters are plain attributes of the Car (an
+    integer increment per event). The row of the trip is written once, when
+    the car leaves the grid, into a preallocated batch of NumPy columns;
+    full batches are written to flush_dir as .npz files, or kept in memory
+    as compact arrays when there is no flush_dir.
+    """
+
+    def __init__(self, batch_size=4096, flush_dir=None, prefix="trips"):
+        """
+        Creates the log.
+        Args:
+            batch_size: Trips per batch
+            flush_dir: Directory of the .npz batches (None = keep the batches in memory)
+            prefix: File name prefix of the batches
+        """
+        self.batch_size = batch_size
+        self.flush_dir = flush_dir
+        self.prefix = prefix
+        self.batch = {name: np.zeros(batch_size, dtype=dtype) for name, dtype in TRIP_COLUMNS.items()}
+        self.size = 0  # Viajes en el batch actual
+        self.batches = []  # Batches terminados en memoria (sin flush_dir)
+        self.batch_paths = []
+        self.count = 0
+        # Sumas de los viajes registrados (para los contadores de Instrumentation)
+        self.totals = {"red_light_waits": 0, "car_blocks": 0, "reroutes": 0}
+        if flush_dir is not None:
+            os.makedirs(flush_dir, exist_ok=True)
+
+    def record(self, car, end_step):
+        """Write the trip of a car that leaves the grid"""
+        i = self.size
+        batch = self.batch
+        batch["car_id"][i] = car.unique_id
+        batch["origin_x"][i], batch["origin_y"][i] = car.origin
+        if car.destination is not None:
+            batch["destination_x"][i], batch["destination_y"][i] = car.destination.coordinate
+        else:
+            batch["destination_x"][i] = batch["destination_y"][i] = -1
+        batch["spawn_step"][i] = car.spawn_step
+        batch["end_step"][i] = end_step
+        batch["arrived"][i] = car.has_arrived
+        batch["red_light_waits"][i] = car.red_light_waits
+        batch["car_blocks"][i] = car.car_blocks
+        batch["reroutes"][i] = car.reroutes
+        batch["moves"][i] = car.moves
+
+        totals = self.totals
+        totals["red_light_waits"] += car.red_light_waits
+        totals["car_blocks"] += car.car_blocks
+        totals["reroutes"] += car.reroutes
+
+        self.size += 1
+        self.count += 1
+        if self.size == self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Close the current batch: write it to flush_dir or keep it in memory"""
+        if not self.size:
+            return None
+        columns = {name: values[:self.size].copy() for name, values in self.batch.items()}
+        self.size = 0
+        if self.flush_dir is None:
+            self.batches.append(columns)
+            return None
+
+        path = os.path.join(self.flush_dir, f"{self.prefix}_{len(self.batch_paths):05d}.npz")
+        np.savez(path, **columns)
+        self.batch_paths.append(path)
+        return path
+
+    def __len__(self):
+        return self.count
+
+    def trips(self):
+        """Every recorded trip as {column: array}"""
+        parts = list(self.batches)
+        for path in self.batch_paths:
+            with np.load(path) as batch:
+                parts.append({name: batch[name] for name in batch.files})
+        parts.append({name: values[:self.size] for name, values in self.batch.items()})
+        return {name: np.concatenate([part[name] for part in parts]) for name in TRIP_COLUMNS}
+
+    def summary(self):
+        """Averages of the arrived trips: travel time, red light waits, car blocks and reroutes"""
+        trips = self.trips()
+        arrived = trips["arrived"]
+        if not arrived.any():
+            return {"trips": len(arrived), "arrived": 0}
+        travel = trips["end_step"][arrived] - trips["spawn_step"][arrived]
+        return {
+            "trips": len(arrived),
+            "arrived": int(arrived.sum()),
+            "mean_travel_steps": float(travel.mean()),
+            "mean_red_light_waits": float(trips["red_light_waits"][arrived].mean()),
+            "mean_car_blocks": float(trips["car_blocks"][arrived].mean()),
+            "mean_reroutes": float(trips["reroutes"][arrived].mean()),
+        }
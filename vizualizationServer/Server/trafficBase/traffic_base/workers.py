@@ -0,0 +1,139 @@
+import itertools
+import multiprocessing
+import os
+import threading
+
+from .model import CityModel
+from .serialization import MODEL_OPERATIONS
+
+def worker_main(conn, cpu):
+    """
+    Loop of a worker process: hosts CityModel instances by model id and
+    runs the operations (serialization.MODEL_OPERATIONS) sent over the pipe.
+    Messages: ("init", id, kwargs), ("run", id, name, args), ("close", id), ("shutdown",)
+    The ids are unique per model (not the session id): a session initialized
+    again gets a new model while the one it replaces is still being closed.
+    """
+    if cpu is not None and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, {cpu})
+
+    models = {}
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            break
+
+        kind = message[0]
+        try:
+            result = None
+            if kind == "init":
+                _, model_id, kwargs = message
+                models[model_id] = CityModel(**kwargs)
+            elif kind == "run":
+                _, model_id, name, args = message
+                result = MODEL_OPERATIONS[name](models[model_id], *args)
+            elif kind == "close":
+                models.pop(message[1], None)
+            elif kind == "shutdown":
+                conn.send(("ok", None))
+                break
+            conn.send(("ok", result))
+        except Exception as e:
+            conn.send(("error", f"{type(e).__name__}: {e}"))
+
+class RemoteModel:
+    """Handle of a CityModel that lives in a worker process of a ModelWorkerPool"""
+
+    def __init__(self, pool, worker, model_id, session_id):
+        self.pool = pool
+        self.worker = worker
+        self.model_id = model_id
+        self.session_id = session_id
+        self.closed = False
+
+    def run_operation(self, name, *args):
+        """Run a model operation (by name) in the worker and return its result"""
+        return self.pool.call(self.worker, ("run", self.model_id, name, args))
+
+    def close(self):
+        """Drop the model from the worker (its load is released even if the worker fails)"""
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            self.pool.call(self.worker, ("close", self.model_id))
+        finally:
+            with self.pool.loads_lock:
+                self.pool.loads[self.worker] -= 1
+
+class ModelWorkerPool:
+    """
+    Pool of worker processes that host the CityModel instances of the server.
+
+    Each model lives in one worker (the one with fewer models when it is
+    created) and every call is forwarded over that worker's pipe, so models
+    of different workers step in parallel instead of sharing the GIL.
+    """
+
+    def __init__(self, num_workers=None, pin_cpus=False, start_method=None):
+        """
+        Starts the workers.
+        Args:
+            num_workers: Number of processes (default: number of CPUs)
+            pin_cpus: Pin worker i to CPU i (modulo the available CPUs), where supported
+            start_method: multiprocessing start method ("fork", "spawn"...), default of the platform
+        """
+        context = multiprocessing.get_context(start_method)
+        self.num_workers = num_workers or os.cpu_count() or 1
+
+        cpus = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else list(range(os.cpu_count() or 1))
+        self.connections = []
+        self.processes = []
+        self.locks = []
+        self.loads = [0] * self.num_workers
+        self.loads_lock = threading.Lock()
+        self.model_ids = itertools.count() # Id de cada modelo en los workers
+        for worker in range(self.num_workers):
+            parent_conn, child_conn = context.Pipe()
+            cpu = cpus[worker % len(cpus)] if pin_cpus else None
+            process = context.Process(target=worker_main, args=(child_conn, cpu), daemon=True)
+            process.start()
+            child_conn.close()
+            self.connections.append(parent_conn)
+            self.processes.append(process)
+            # Un pipe no es seguro entre hilos: una llamada a la vez por worker
+            self.locks.append(threading.Lock())
+
+    def call(self, worker, message):
+        """Send a message to a worker and wait for its answer"""
+        with self.locks[worker]:
+            self.connections[worker].send(message)
+            status, result = self.connections[worker].recv()
+        if status == "error":
+            raise RuntimeError(f"Worker {worker}: {result}")
+        return result
+
+    def create_model(self, session_id, **kwargs):
+        """Create a CityModel(**kwargs) in the least loaded worker. Returns its RemoteModel."""
+        with self.loads_lock:
+            worker = min(range(self.num_workers), key=lambda i: self.loads[i])
+            self.loads[worker] += 1
+            model_id = next(self.model_ids)
+        try:
+            self.call(worker, ("init", model_id, kwargs))
+        except Exception:
+            with self.loads_lock:
+                self.loads[worker] -= 1
+            raise
+        return RemoteModel(self, worker, model_id, session_id)
+
+    def shutdown(self):
+        """Stop every worker"""
+        for worker, process in enumerate(self.processes):
+            if process.is_alive():
+                try:
+                    self.call(worker, ("shutdown",))
+                except (EOFError, OSError, RuntimeError):
+                    pass
+            process.join(timeout=5)
@@ -2,17 +2,66 @@
 # Python flask server to interact with webGL.
 # Octavio Navarro. 2024
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 from flask_cors import CORS, cross_origin
-from traffic_base.model import CityModel
-from traffic_base.agent import Car, Traffic_Light, Destination, Obstacle, Road
+import gzip
+import hashlib
+import json
+import os
+import time
+from traffic_base.instrumentation import prometheus_text
+from traffic_base.model import GRAPH_BACKENDS, CityModel
+from traffic_base.sessions import DEFAULT_SESSION, SessionRegistry
+from traffic_base.workers import ModelWorkerPool
+
+# Brotli is optional: without it the static layers are only precompressed with gzip
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# MessagePack is optional: /step?format=msgpack needs it
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# flask_sock is optional: without it there is no /stream WebSocket endpoint
+try:
+    from flask_sock import Sock
+except ImportError:
+    Sock = None
 
 # Size of the board:
 # Declarar variables globales cin características del agente y dónde se guarda el modelo
 number_agents = 300
 spawn_time = 10
-cityModel = None
-currentStep = 0
+graph_backend = "dict" # "dict" o "csr"
+
+# Cada simulación vive en una sesión: modelo, step actual, capas estáticas serializadas
+# ({name: {"etag", "identity", "gzip", "br"}}) y un lock propio, así que varios modelos
+# pueden avanzar en paralelo. Sin id de sesión se usa DEFAULT_SESSION (clientes anteriores).
+sessions = SessionRegistry(max_sessions=16, idle_timeout=1800)
+
+# TRAFFIC_WORKERS=n hospeda los modelos en n procesos worker (0 = en el proceso del servidor),
+# TRAFFIC_PIN_WORKERS=1 fija cada worker a un CPU. Los endpoints usan session.run en ambos casos.
+num_workers = int(os.environ.get('TRAFFIC_WORKERS', 0))
+worker_pool = None
+
+def start_worker_pool():
+    """
+    Start the worker pool of the server (from __main__, before serving requests).
+    Workers are spawned, not forked: forking a process with request threads is unsafe,
+    and spawn re-imports this module, so the pool is never started at import.
+    """
+    global worker_pool
+    if worker_pool is None and num_workers > 0:
+        worker_pool = ModelWorkerPool(num_workers, pin_cpus=os.environ.get('TRAFFIC_PIN_WORKERS') == '1',
+                                      start_method="spawn")
+    return worker_pool
+
+# TRAFFIC_INSTRUMENTATION=1 mide el tiempo de cada fase del step en los modelos nuevos (/metrics)
+instrumentation = os.environ.get('TRAFFIC_INSTRUMENTATION') == '1'
 
 ########################################################################
 ### Initialize the interaction between the simulation and the server ###
@@ -24,71 +73,114 @@ app = Flask("Traffic example")
 cors = CORS(app, 
     origins=['http://localhost:', 'http://127.0.0.1:'],
     methods=['GET', 'POST', 'OPTIONS'],
-    allow_headers=['Content-Type'],
+    allow_headers=['Content-Type', 'X-Session-Id'],
     supports_credentials=True
 )
 
+def request_session_id():
+    """Session of the request: ?session=, the X-Session-Id header or the default session"""
+    return request.args.get('session') or request.headers.get('X-Session-Id') or DEFAULT_SESSION
+
+def unknown_session():
+    return jsonify({"message": f"Unknown session {request_session_id()}, call /init first"}), 404
+
 # This route will be used to send the parameters of the simulation to the server.
 # The servers expects a POST request with the parameters in a.json.
+# "Session" (in the json or ?session=) chooses the session: "new" creates one with a new id,
+# an existing id is initialized again and without it the default session is used.
+# The response includes the session id that the other endpoints receive in ?session= or X-Session-Id.
 @app.route('/init', methods=['GET', 'POST'])
 @cross_origin()
 def initModel():
-    global currentStep, cityModel, number_agents, spawn_time
+    global number_agents, spawn_time, graph_backend
 
+    session_id = request_session_id()
     if request.method == 'POST':
         try:
             number_agents = int(request.json.get('NAgents'))
             spawn_time = int(request.json.get('STime'))
-            currentStep = 0
+            backend = request.json.get('GraphBackend', graph_backend)
+            session_id = request.json.get('Session', session_id)
 
         except Exception as e:
             print(e)
             return jsonify({"message": "Error initializing the model"}), 500
 
+        # Validar antes de guardar el backend: CityModel lanzaría ValueError al crear la sesión
+        if backend not in GRAPH_BACKENDS:
+            return jsonify({"message": f"Unknown graph backend: {backend}. Use one of {', '.join(GRAPH_BACKENDS)}"}), 400
+        graph_backend = backend
+
     print(f"Model parameters: Max. num agents: {number_agents} and spawn time: {spawn_time}")
 
     # Create the model using the parameters sent by the application
-    cityModel = CityModel(number_agents, spawn_time)
+    parameters = {"N": number_agents, "spawn_time": spawn_time, "graph_backend": graph_backend,
+                  "instrumentation": instrumentation}
+    pool = worker_pool
+    if pool is not None:
+        factory = lambda sid: pool.create_model(sid, **parameters)
+    else:
+        factory = lambda sid: CityModel(**parameters)
+    session = sessions.create(factory, None if session_id == "new" else session_id)
 
     # Return a message to saying that the model was created successfully
-    return jsonify({"message": f"Parameters recieved, model initiated. Maximum umber of agents: {number_agents}"})
+    return jsonify({
+        "message": f"Parameters recieved, model initiated. Maximum umber of agents: {number_agents}",
+        "session": session.session_id
+    })
 
 
 ####################################
 ### Get info from all the agents ###
 ####################################
 
+def static_layer_response(session, name, layer_name):
+    """
+    Response with the positions of a static layer, serialized and compressed only once per model.
+    Supports If-None-Match (304 when the client already has it) and gzip / brotli encodings.
+    """
+    with session.lock:
+        layer = session.static_layers.get(name)
+        if layer is None:
+            body = json.dumps({'positions': session.run("static", layer_name)}, separators=(",", ":")).encode()
+            layer = {
+                "etag": hashlib.sha1(body).hexdigest(),
+                "identity": body,
+                "gzip": gzip.compress(body, compresslevel=6),
+                "br": brotli.compress(body) if brotli is not None else None,
+            }
+            session.static_layers[name] = layer
+
+    headers = {"ETag": f'"{layer["etag"]}"', "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+    if request.if_none_match.contains(layer["etag"]):
+        return Response(status=304, headers=headers)
+
+    if layer["br"] is not None and request.accept_encodings["br"]:
+        body, headers["Content-Encoding"] = layer["br"], "br"
+    elif request.accept_encodings["gzip"]:
+        body, headers["Content-Encoding"] = layer["gzip"], "gzip"
+    else:
+        body = layer["identity"]
+    return Response(body, mimetype="application/json", headers=headers)
+
+
 # This route will be used to get the positions of the agent car
 @app.route('/getCars', methods=['GET'])
 @cross_origin()
 def getCars():
-    global cityModel
-
     if request.method == 'GET':
         # Get the positions of the agents and return them to WebGL in JSON.json.t.
         # Note that the positions are sent as a list of dictionaries, where each dictionary has the id and position of an agent.
         # The y coordinate is set to 1, since the agents are in a 3D world. The z coordinate corresponds to the row (y coordinate) of the grid in mesa.
+        # The positions come from the model car tracker (no grid scan). With ?since=<version> only the cars
+        # added, moved or removed after that version are sent; "full" tells if it is a complete snapshot instead.
+        session = sessions.get(request_session_id())
+        if session is None:
+            return unknown_session()
         try:
-            carCells = cityModel.grid.all_cells.select(
-                lambda cell: any(isinstance(obj, Car) for obj in cell.agents)
-            ).cells
-            # print(f"CELLS: {agentCells}")
-
-            cars = [
-                (cell.coordinate, agent)
-                for cell in carCells
-                for agent in cell.agents
-                if isinstance(agent, Car)
-            ]
-            # print(f"AGENTS: {cars}")
-
-            carPositions = [
-                {"id": str(car.unique_id), "x": coordinate[0], "y": 1, "z": coordinate[1]}
-                for (coordinate, car) in cars
-            ]
-            # print(f"AGENT POSITIONS: {carPositions}")
-
-            return jsonify({'positions': carPositions})
+            since = request.args.get('since', type=int)
+
+            return jsonify(session.run("cars", since))
         except Exception as e:
             print(e)
             return jsonify({"message": "Error with the agent positions"}), 500
@@ -97,33 +189,14 @@ def getCars():
 @app.route('/getObstacles', methods=['GET'])
 @cross_origin()
 def getObstacles():
-    global cityModel
-
     if request.method == 'GET':
-        # Get the positions of the agents and return them to WebGL in JSON.json.t.
-        # Note that the positions are sent as a list of dictionaries, where each dictionary has the id and position of an agent.
-        # The y coordinate is set to 1, since the agents are in a 3D world. The z coordinate corresponds to the row (y coordinate) of the grid in mesa.
+        # The positions are sent as a list of dictionaries with the id and position of each agent.
+        # They never change after the model is created, so they are serialized once (see static_layer_response).
+        session = sessions.get(request_session_id())
+        if session is None:
+            return unknown_session()
         try:
-            obstacleCells = cityModel.grid.all_cells.select(
-                lambda cell: any(isinstance(obj, Obstacle) for obj in cell.agents)
-            ).cells
-            # print(f"CELLS: {obstacleCells}")
-
-            obstacles = [
-                (cell.coordinate, agent)
-                for cell in obstacleCells
-                for agent in cell.agents
-                if isinstance(agent, Obstacle)
-            ]
-            # print(f"AGENTS: {obstacles}")
-
-            obstaclePositions = [
-                {"id": str(obs.unique_id), "x": coordinate[0], "y": 1, "z": coordinate[1]}
-                for (coordinate, obs) in obstacles
-            ]
-            # print(f"AGENT POSITIONS: {obstaclePositions}")
-
-            return jsonify({'positions': obstaclePositions})
+            return static_layer_response(session, "getObstacles", "Obstacle")
         except Exception as e:
             print(e)
             return jsonify({"message": "Error with the agent positions"}), 500
@@ -132,33 +205,14 @@ def getObstacles():
 @app.route('/getRoad', methods=['GET'])
 @cross_origin()
 def getRoad():
-    global cityModel
-
     if request.method == 'GET':
+        # The positions are sent as a list of dictionaries with the id and position of each agent.
+        # They never change after the model is created, so they are serialized once (see static_layer_response).
+        session = sessions.get(request_session_id())
+        if session is None:
+            return unknown_session()
         try:
-            # Get the positions of the road and return them to WebGL in JSON.json.t.
-            # Same as before, the positions are sent as a list of dictionaries, where each dictionary has the id and position of a car.
-
-            roadCells = cityModel.grid.all_cells.select(
-                lambda cell: any(isinstance(obj, Road) for obj in cell.agents)
-            )
-            #print(f"CELLS: {roadCells}")
-
-            agents = [
-                (cell.coordinate, agent)
-                for cell in roadCells
-                for agent in cell.agents
-                if isinstance(agent, Road)
-            ]
-            # print(f"AGENTS: {roadCells}")
-
-            roadPositions = [
-                {"id": str(a.unique_id), "x": coordinate[0], "y":1, "z":coordinate[1]}
-                for (coordinate, a) in agents
-            ]
-            #print(f"ROAD POSITIONS: {roadPositions}")
-
-            return jsonify({'positions': roadPositions})
+            return static_layer_response(session, "getRoad", "Road")
         except Exception as e:
             print(e)
             return jsonify({"message": "Error with road positions"}), 500
@@ -167,32 +221,14 @@ def getRoad():
 @app.route('/getTrafficLights', methods=['GET'])
 @cross_origin()
 def getTrafficLights():
-    global cityModel
-
     if request.method == 'GET':
+        session = sessions.get(request_session_id())
+        if session is None:
+            return unknown_session()
         try:
-            trafficLightsCells = cityModel.grid.all_cells.select(
-                lambda cell: any(isinstance(obj, Traffic_Light) for obj in cell.agents)
-            )
-
-            agents = [
-                (cell.coordinate, agent)
-                for cell in trafficLightsCells
-                for agent in cell.agents
-                if isinstance(agent, Traffic_Light)
-            ]
-
-            trafficLightsPositions = [
-                {
-                    "id": str(a.unique_id), 
-                    "x": coordinate[0], 
-                    "y": 1, 
-                    "z": coordinate[1],
-                    "state": "green" if a.state else "red", 
-                    "direction": a.direction  
-                }
-                for (coordinate, a) in agents
-            ]
+            # Optional ?step=: state of the lights after that step, computed without stepping
+            step = request.args.get('step', type=int)
+            trafficLightsPositions = session.run("traffic_lights", step)
 
             return jsonify({'positions': trafficLightsPositions})
         except Exception as e:
@@ -203,55 +239,185 @@ def getTrafficLights():
 @app.route('/getDestinations', methods=['GET'])
 @cross_origin()
 def getDestinations():
-    global cityModel
-
     if request.method == 'GET':
+        # The positions are sent as a list of dictionaries with the id and position of each agent.
+        # They never change after the model is created, so they are serialized once (see static_layer_response).
+        session = sessions.get(request_session_id())
+        if session is None:
+            return unknown_session()
         try:
-            # Get the positions of the road and return them to WebGL in JSON.json.t.
-            # Same as before, the positions are sent as a list of dictionaries, where each dictionary has the id and position of a car.
-
-            destinationCells = cityModel.grid.all_cells.select(
-                lambda cell: any(isinstance(obj, Destination) for obj in cell.agents)
-            )
-            #print(f"CELLS: {roadCells}")
-
-            destinations = [
-                (cell.coordinate, agent)
-                for cell in destinationCells
-                for agent in cell.agents
-                if isinstance(agent, Destination)
-            ]
-            # print(f"AGENTS: {roadCells}")
-
-            destinationPositions = [
-                {"id": str(a.unique_id), "x": coordinate[0], "y":1, "z":coordinate[1]}
-                for (coordinate, a) in destinations
-            ]
-            #print(f"ROAD POSITIONS: {destinationPositions}")
-
-            return jsonify({'positions': destinationPositions})
+            return static_layer_response(session, "getDestinations", "Destination")
         except Exception as e:
             print(e)
             return jsonify({"message": "Error with road positions"}), 500
 
 
+# This route will be used to get the last samples of the model metrics (Active_cars, Total_arrived...)
+# as columns: /getMetrics?last=100
+@app.route('/getMetrics', methods=['GET'])
+@cross_origin()
+def getMetrics():
+    if request.method == 'GET':
+        session = sessions.get(request_session_id())
+        if session is None:
+            return unknown_session()
+        try:
+            last = request.args.get('last', default=100, type=int)
+            return jsonify(session.run("metrics", last))
+        except Exception as e:
+            print(e)
+            return jsonify({"message": "Error with the metrics"}), 500
+
+
+# This route will be used by Prometheus to scrape the counters and phase timers of every session
+@app.route('/metrics', methods=['GET'])
+def prometheusMetrics():
+    if request.method == 'GET':
+        try:
+            snapshots = []
+            for session in sessions.list():
+                with session.lock:
+                    snapshots.append(({"session": session.session_id}, session.run("instrumentation")))
+            return Response(prometheus_text(snapshots), content_type='text/plain; version=0.0.4; charset=utf-8')
+        except Exception as e:
+            print(e)
+            return jsonify({"message": "Error with the instrumentation metrics"}), 500
+
+
 # This route will be used to update the model
 # Hace el step del modelo
 @app.route('/update', methods=['GET'])
 @cross_origin()
 def updateModel():
-    global currentStep, cityModel
     if request.method == 'GET':
+        session = sessions.get(request_session_id())
+        if session is None:
+            return unknown_session()
         try:
         # Update the model and return a message to WebGL saying that the model was updated successfully
-            cityModel.step()
-            currentStep += 1
+            with session.lock:
+                session.run("step")
+                session.current_step += 1
+                currentStep = session.current_step
             return jsonify({'message': f'Model updated to step {currentStep}.', 'currentStep':currentStep})
         except Exception as e:
             print(e)
             return jsonify({"message": "Error during step."}), 500
 
 
+# Advance the model k steps and return the frame of the last step (or of every step with all=1)
+# in one call: /step?k=10&all=0&format=columnar|msgpack
+# Columnar frame: {"step", "ids", "x", "z", "heading", "lights"}; "lightIds" gives the order of "lights".
+MAX_STEPS_PER_REQUEST = 1000
+
+@app.route('/step', methods=['GET'])
+@cross_origin()
+def stepModel():
+    if request.method == 'GET':
+        k = request.args.get('k', default=1, type=int)
+        all_steps = request.args.get('all', default=0, type=int) == 1
+        output_format = request.args.get('format', default='columnar')
+
+        if k < 1 or k > MAX_STEPS_PER_REQUEST:
+            return jsonify({"message": f"k must be between 1 and {MAX_STEPS_PER_REQUEST}"}), 400
+        if output_format not in ('columnar', 'msgpack'):
+            return jsonify({"message": f"Unknown format: {output_format}"}), 400
+        if output_format == 'msgpack' and msgpack is None:
+            return jsonify({"message": "MessagePack is not installed on the server"}), 501
+
+        session = sessions.get(request_session_id())
+        if session is None:
+            return unknown_session()
+        try:
+            with session.lock:
+                frames = session.run("advance", k, all_steps)
+                session.current_step += k
+                light_ids = session.run("light_ids")
+                currentStep = session.current_step
+
+            payload = {'currentStep': currentStep, 'lightIds': light_ids, 'frames': frames}
+            if output_format == 'msgpack':
+                return Response(msgpack.packb(payload), mimetype='application/msgpack')
+            return Response(json.dumps(payload, separators=(",", ":")), mimetype='application/json')
+        except Exception as e:
+            print(e)
+            return jsonify({"message": "Error during step."}), 500
+
+
+##############################################
+### Streaming of binary frames (WebSocket) ###
+##############################################
+
+def run_stream(ws, session, interval, steps_per_frame, max_in_flight):
+    """
+    Step the model continuously and push a binary frame (serialization.encode_frame) after each step.
+    The client answers every frame with "ack". When max_in_flight frames are still unacknowledged the
+    client is behind: the model keeps running and frames are skipped (the next one sent reports how many).
+    """
+    lights = session.run("light_ids")
+    ws.send(json.dumps({"type": "hello", "lights": lights}))
+
+    in_flight = 0
+    skipped = 0
+    next_frame = time.perf_counter()
+    while True:
+        # Mensajes del cliente: "ack" por cada frame recibido, "close" para terminar
+        message = ws.receive(timeout=0)
+        while message is not None:
+            if message == "ack":
+                in_flight = max(in_flight - 1, 0)
+            elif message == "close":
+                return
+            message = ws.receive(timeout=0)
+
+        with session.lock:
+            running, frame = session.run("stream", steps_per_frame, skipped, in_flight < max_in_flight)
+            if not running:
+                return
+            session.current_step += steps_per_frame
+
+        # Mantener viva la sesión mientras se transmite
+        session.touch()
+        if frame is None:
+            skipped += 1
+        else:
+            ws.send(frame)
+            in_flight += 1
+            skipped = 0
+
+        next_frame += interval
+        delay = next_frame - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        else:
+            next_frame = time.perf_counter()
+
+if Sock is not None:
+    sock = Sock(app)
+
+    # ws://localhost:8585/stream?fps=30&steps=1&inFlight=2&session=<id>
+    @sock.route('/stream')
+    def streamFrames(ws):
+        session = sessions.get(request_session_id())
+        if session is None:
+            ws.close(reason=1008, message="Unknown session")
+            return
+        fps = request.args.get('fps', default=30, type=float)
+        steps_per_frame = max(request.args.get('steps', default=1, type=int), 1)
+        max_in_flight = max(request.args.get('inFlight', default=2, type=int), 1)
+        try:
+            run_stream(ws, session, 1 / max(fps, 1), steps_per_frame, max_in_flight)
+        except Exception as e:
+            # The client closed the connection
+            print(e)
+
+
 if __name__=='__main__':
+    debug = True
+    # Con debug el reloader vuelve a ejecutar este script en un proceso hijo que es el que
+    # atiende las peticiones: los workers se inician solo en ese proceso
+    if not debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_worker_pool()
+
     # Run the flask server in port 8585
-    app.run(host="localhost", port=8585, debug=True)
\ No newline at end of file
+    app.run(host="localhost", port=8585, debug=debug)
\ No newline at end of file
@@ -14,6 +14,20 @@ import { Object3D } from '../libs/object3d';
 // Define the agent server URI
 const agent_server_uri = "http://localhost:8585/";
 
+// Sesión del servidor para esta pestaña (la regresa /init); null = sesión nueva en el próximo /init
+let sessionId = null;
+
+/*
+ * URI of an endpoint of the agent server for the current session.
+ */
+function serverUri(path) {
+    if (sessionId === null) {
+        return agent_server_uri + path;
+    }
+    const separator = path.includes("?") ? "&" : "?";
+    return agent_server_uri + path + separator + "session=" + encodeURIComponent(sessionId);
+}
+
 // Initialize arrays to store agents and obstacles
 const obstacles = [];
 const traffic_lights = [];
@@ -46,7 +60,7 @@ if (typeof window !== 'undefined') {
  * Envía un diccionario para que se inicialize en el servidor
  */
 async function initAgentsModel() {
-    const url = "http://localhost:8585/init";
+    const url = agent_server_uri + "init";
     
     try {
         const response = await fetch(url, {
@@ -56,83 +70,67 @@ async function initAgentsModel() {
             },
             body: JSON.stringify({
                 NAgents: apiSettings.number_agents,
-                STime: apiSettings.spawn_time
+                STime: apiSettings.spawn_time,
+                // Reusar la sesión de esta pestaña o pedir una nueva
+                Session: sessionId === null ? "new" : sessionId
             })
         });
         
         const data = await response.json();
         console.log(data.message);
+        sessionId = data.session;
+
+        // Modelo nuevo: la próxima llamada a getCars pide todos los carros
+        carsVersion = null;
         return data;
     } catch (error) {
         console.error("Error initializing agents model:", error);
     }
 }
 
+// Versión (step del modelo) de las posiciones de carros que tiene el cliente
+let carsVersion = null;
+
 /*
- * Retrieves the current positions of all agents from the agent server.
- * Contesta con todos los agentes que están en la simulación.
+ * Retrieves the positions of the agents from the agent server.
+ * La primera vez pide todos los carros; después solo los que se agregaron,
+ * movieron o eliminaron desde carsVersion (getCars?since=).
+ * Si el servidor ya no tiene esos cambios, contesta con todos los carros (full).
  * Regresa toda la infomación de los agentes (id, pos en x,y,z)
  * Aquí se debe de modificar si se requiere info extra
  */
 async function getCars() {
     try {
         // Send a GET request to the agent server to retrieve the agent positions
-        let response = await fetch(agent_server_uri + "getCars");
+        const query = carsVersion === null ? "getCars" : `getCars?since=${carsVersion}`;
+        let response = await fetch(serverUri(query));
 
         // Check if the response was successful
         if (response.ok) {
             // Parse the response as JSON
             let result = await response.json();
 
-            // Log the agent positions
-            //console.log("getAgents positions: ", result.positions)
-
-            // Check if the agents array is empty
-            // Poner la visualización inicial de los agentes
-            // Se debe de cambiar esto para poder agregar nuevos agentes
-            if (cars.length == 0) {
-                // Create new agents and add them to the agents array
-                for (const car of result.positions) {
-                    const newCar = new Object3D(car.id, [car.x, car.y, car.z]);
-                    // Store the initial position
-                    newCar['oldPosArray'] = newCar.posArray;
-                    cars.push(newCar);
-                }
-                // Log the agents array
-                //console.log("Agents:", agents);
-
-            } else { // Para iteraciones futuras, actualizar la posición
-                // Get IDs from server response
+            if (result.full) {
+                // Snapshot completo: reemplazar los carros, conservando los que ya existían
                 const serverCarIds = new Set(result.positions.map(c => c.id));
-                
-                // Remove cars that are no longer in the server response
                 for (let i = cars.length - 1; i >= 0; i--) {
                     if (!serverCarIds.has(cars[i].id)) {
                         cars.splice(i, 1);
                     }
                 }
-                
-                // Update the positions of existing agents
-                // Sincronización entre el objeto de Mesa y el de WebGL
-                for (const car of result.positions) {
-                    const current_car = cars.find((object3d) => object3d.id == car.id);
-
-                    // Check if the agent exists in the agents array
-                    if(current_car != undefined){
-                        // Update the agent's position
-                        current_car.oldPosArray = current_car.posArray;
-                        current_car.position = {x: car.x, y: car.y, z: car.z};
-                    } else {
-                        // Create new car if it doesn't exist
-                        const newCar = new Object3D(car.id, [car.x, car.y, car.z]);
-                        newCar['oldPosArray'] = newCar.posArray;
-                        cars.push(newCar);
+                updateCarPositions(result.positions);
+            } else {
+                // Remove cars that arrived to their destination
+                const removedIds = new Set(result.removed);
+                for (let i = cars.length - 1; i >= 0; i--) {
+                    if (removedIds.has(cars[i].id)) {
+                        cars.splice(i, 1);
                     }
-
-                    //console.log("OLD: ", current_agent.oldPosArray,
-                    //            " NEW: ", current_agent.posArray);
                 }
+                updateCarPositions(result.added);
+                updateCarPositions(result.moved);
             }
+            carsVersion = result.version;
         }
 
     } catch (error) {
@@ -141,6 +139,32 @@ async function getCars() {
     }
 }
 
+/*
+ * Updates (or creates) the cars of a list of positions sent by the server.
+ * Sincronización entre el objeto de Mesa y el de WebGL
+ */
+function updateCarPositions(positions) {
+    const carsById = new Map(cars.map(car => [car.id, car]));
+
+    for (const car of positions) {
+        const current_car = carsById.get(car.id);
+
+        // Check if the agent exists in the agents array
+        if (current_car != undefined) {
+            // Update the agent's position
+            current_car.oldPosArray = current_car.posArray;
+            current_car.position = {x: car.x, y: car.y, z: car.z};
+        } else {
+            // Create new car if it doesn't exist
+            const newCar = new Object3D(car.id, [car.x, car.y, car.z]);
+            // Store the initial position
+            newCar['oldPosArray'] = newCar.posArray;
+            cars.push(newCar);
+            carsById.set(car.id, newCar);
+        }
+    }
+}
+
 /*
  * Retrieves the current positions of all obstacles from the agent server.
  * Obtiene la información de los obstáculos (id's, posiciones iniciales)
@@ -148,7 +172,7 @@ async function getCars() {
 async function getObstacles() {
     try {
         // Send a GET request to the agent server to retrieve the obstacle positions
-        let response = await fetch(agent_server_uri + "getObstacles");
+        let response = await fetch(serverUri("getObstacles"));
 
         // Check if the response was successful
         if (response.ok) {
@@ -180,7 +204,7 @@ async function getObstacles() {
  */
 async function getTrafficLights() {
     try {
-        let response = await fetch(agent_server_uri + "getTrafficLights");
+        let response = await fetch(serverUri("getTrafficLights"));
 
         if (response.ok) {
             let result = await response.json();
@@ -225,7 +249,7 @@ async function getTrafficLights() {
 async function getRoad() {
     try {
         // Send a GET request to the agent server to retrieve the road positions
-        let response = await fetch(agent_server_uri + "getRoad");
+        let response = await fetch(serverUri("getRoad"));
 
         // Check if the response was successful
         if (response.ok) {
@@ -254,7 +278,7 @@ async function getRoad() {
 async function getDestinations() {
     try {
         // Send a GET request to the agent server to retrieve the obstacle positions
-        let response = await fetch(agent_server_uri + "getDestinations");
+        let response = await fetch(serverUri("getDestinations"));
 
         // Check if the response was successful
         if (response.ok) {
@@ -283,7 +307,7 @@ async function getDestinations() {
 async function update() {
     try {
         // Send a request to the agent server to update the agent positions
-        let response = await fetch(agent_server_uri + "update");
+        let response = await fetch(serverUri("update"));
 
         // Check if the response was successful
         if (response.ok) {
@@ -300,6 +324,74 @@ async function update() {
     }
 }
 
+/*
+ * Opens the /stream WebSocket: the server runs steps continuously and pushes binary frames.
+ * Frame (little endian): header "TRF1", step u32, cars u32, lights u32, skipped u32 (20 bytes),
+ * then car ids u32[], x u16[], z u16[], heading u8[] and a bitset with the light states.
+ * Cada frame se confirma con "ack"; si el cliente se atrasa el servidor se salta frames.
+ * onFrame(step, skipped) se llama después de actualizar cars y traffic_lights.
+ * Regresa el WebSocket (ws.close() para detener el stream)
+ */
+function streamFrames(onFrame, { fps = 30, steps = 1, inFlight = 2 } = {}) {
+    const stream_uri = serverUri(`stream?fps=${fps}&steps=${steps}&inFlight=${inFlight}`).replace(/^http/, "ws");
+    const ws = new WebSocket(stream_uri);
+    ws.binaryType = "arraybuffer";
+
+    // Ids de los semáforos en el orden de los bits (llegan en el mensaje "hello")
+    let lightIds = [];
+
+    ws.onmessage = (event) => {
+        if (typeof event.data === "string") {
+            const message = JSON.parse(event.data);
+            if (message.type === "hello") {
+                lightIds = message.lights;
+            }
+            return;
+        }
+
+        const buffer = event.data;
+        const header = new DataView(buffer, 0, 20);
+        const step = header.getUint32(4, true);
+        const count = header.getUint32(8, true);
+        const lightCount = header.getUint32(12, true);
+        const skipped = header.getUint32(16, true);
+
+        const ids = new Uint32Array(buffer, 20, count);
+        const xs = new Uint16Array(buffer, 20 + 4 * count, count);
+        const zs = new Uint16Array(buffer, 20 + 6 * count, count);
+        const lightBits = new Uint8Array(buffer, 20 + 9 * count);
+
+        // Los carros que no vienen en el frame ya llegaron a su destino
+        const frameIds = new Set(Array.from(ids, id => String(id)));
+        for (let i = cars.length - 1; i >= 0; i--) {
+            if (!frameIds.has(cars[i].id)) {
+                cars.splice(i, 1);
+            }
+        }
+        const positions = [];
+        for (let i = 0; i < count; i++) {
+            positions.push({id: String(ids[i]), x: xs[i], y: 1, z: zs[i]});
+        }
+        updateCarPositions(positions);
+
+        const lightsById = new Map(traffic_lights.map(tl => [tl.id, tl]));
+        for (let i = 0; i < lightCount && i < lightIds.length; i++) {
+            const current_tl = lightsById.get(lightIds[i]);
+            if (current_tl != undefined) {
+                current_tl.state = (lightBits[i >> 3] >> (i & 7)) & 1 ? 'green' : 'red';
+            }
+        }
+
+        ws.send("ack");
+        if (onFrame) {
+            onFrame(step, skipped);
+        }
+    };
+
+    ws.onerror = (error) => console.log(error);
+    return ws;
+}
+
 export {    obstacles, cars, traffic_lights, roads, destinations,
-            initAgentsModel, update, 
+            initAgentsModel, update, streamFrames,
             getObstacles, getCars, getTrafficLights, getRoad, getDestinations };